@@ -0,0 +1,101 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+def declares(agent):
+    return bool(agent.reads or agent.writes)
+
+def conflicts(earlier, later):
+    """True when `later` must wait for `earlier`: read-after-write, write-after-read or write-after-write."""
+    earlier_reads, earlier_writes = set(earlier.reads), set(earlier.writes)
+    later_reads, later_writes = set(later.reads), set(later.writes)
+    return bool(earlier_writes & later_reads or earlier_reads & later_writes or earlier_writes & later_writes)
+
+class AgentScheduler:
+    """
+    Runs agents as a dependency DAG built from the context keys they declare
+    (reads/writes), keeping list order wherever two agents touch the same key.
+    Independent agents run concurrently, each on its own copy of the context,
+    and only the keys an agent declares it writes are merged back, so the
+    resulting context does not depend on timing. Agents that declare nothing
+    act as barriers: they run alone and everything they return is merged.
+    """
+    def __init__(self, agents, max_workers=4, step_delay=0):
+        self.agents = agents
+        self.max_workers = max_workers
+        self.step_delay = step_delay
+        self.dependencies = self.build_dependencies(agents)
+
+    @staticmethod
+    def build_dependencies(agents):
+        """:return: per agent, the indices of the earlier agents it waits for"""
+        dependencies = []
+        for j, later in enumerate(agents):
+            needs = set()
+            for i in range(j):
+                earlier = agents[i]
+                if not declares(earlier) or not declares(later) or conflicts(earlier, later):
+                    needs.add(i)
+            dependencies.append(needs)
+        return dependencies
+
+    def run(self, context, on_start=None, on_finish=None, completed=(), lock=None):
+        """
+        Execute every agent once its dependencies have finished.
+        :param on_start: called with an agent when it is submitted
+        :param on_finish: called with an agent after its writes were merged
+        :param completed: names of agents whose writes are already in `context` (resuming)
+        :param lock: held while writes are merged, for other threads reading `context`
+        :return: the updated context (the same dict that was passed in)
+        """
+        finished = {i for i, agent in enumerate(self.agents) if agent.name in completed}
+        pending = set(range(len(self.agents))) - finished
+        running = {} # future -> agent index
+
+        error = None
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while (pending and error is None) or running:
+                if error is None:
+                    for i in sorted(pending):
+                        if self.dependencies[i] <= finished:
+                            pending.discard(i)
+                            if on_start:
+                                on_start(self.agents[i])
+                            running[executor.submit(self._execute, self.agents[i], dict(context))] = i
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                # Agents that finish together are merged in list order
+                for future in sorted(done, key=running.get):
+                    i = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        # Start nothing new, but keep what the agents still running produce
+                        error = error or e
+                        continue
+                    if lock is None:
+                        self.merge(context, self.agents[i], result)
+                    else:
+                        with lock:
+                            self.merge(context, self.agents[i], result)
+                    finished.add(i)
+                    if on_finish:
+                        on_finish(self.agents[i])
+        if error is not None:
+            raise error
+        return context
+
+    def _execute(self, agent, snapshot):
+        result = agent.execute(snapshot)
+        if self.step_delay:
+            time.sleep(self.step_delay)
+        return result
+
+    def merge(self, context, agent, result):
+        if result is None:
+            return
+        if not declares(agent):
+            context.update(result)
+            return
+        for key in agent.writes:
+            if key in result:
+                context[key] = result[key]
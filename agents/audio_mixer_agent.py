@@ -3,6 +3,9 @@ from pydub import AudioSegment, effects
 import os
 
 class AudioMixerAgent(BaseAgent):
+    reads = ('audio_path', 'audio_url')
+    writes = ('final_audio_url',)
+
     def __init__(self, llm_client):
         super().__init__("AudioMixerAgent", llm_client)
 
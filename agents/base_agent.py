@@ -2,6 +2,11 @@ from abc import ABC, abstractmethod
 import time
 
 class BaseAgent(ABC):
+    # Context keys the agent uses and sets; the orchestrator schedules from these.
+    # An agent that declares neither runs alone, after everything before it.
+    reads = ()
+    writes = ()
+
     def __init__(self, name, llm_client):
         self.name = name
         self.llm_client = llm_client
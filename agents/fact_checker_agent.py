@@ -1,21 +1,140 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
 from .base_agent import BaseAgent
-from prompts import PROMPT_FACT_CHECKER_V1
+from prompts import PROMPT_FACT_CHECKER_V2
+from context_packer import ContextPacker, PROMPT_BUDGETS
+from extraction_parser import loads_or_none, scan_objects, largest_top_level
+from index_cache import GraphIndexCache
+from source_index import SourceIndex
+from text_utils import split_sentences
+
+# A one-word label ("Host:", "**Guest 2:**"), not a clause that happens to end in a colon
+SPEAKER_PATTERN = re.compile(r'^\s*[*_]*(?:Host|Guest|[A-Z]\w*)(?: \d+)?[*_]*\s*:[*_]*\s*')
+VERDICTS = ('supported', 'contradicted', 'unsupported')
 
 class FactCheckerAgent(BaseAgent):
-    def __init__(self, llm_client):
+    reads = ('script', 'source_content')
+    writes = ('verification_notes', 'claim_verdicts')
+
+    def __init__(self, llm_client, max_evidence_tokens=PROMPT_BUDGETS['fact_check_evidence'],
+                 claims_per_call=6, passages_per_claim=3, max_workers=4, max_claims=200, min_claim_words=6):
         super().__init__("FactCheckerAgent", llm_client)
+        self.packer = ContextPacker(llm_client)
+        self.max_evidence_tokens = max_evidence_tokens
+        self.claims_per_call = claims_per_call
+        self.passages_per_claim = passages_per_claim
+        self.max_workers = max_workers
+        self.max_claims = max_claims
+        self.min_claim_words = min_claim_words
+        # Source indexes by content hash; jobs on the same source share one build
+        self.source_indexes = GraphIndexCache(max_entries=4, size_fn=SourceIndex.estimate_bytes)
 
     def execute(self, context):
         self.log("Verifying facts in the script...")
-        script = context.get('script')
-        source_content = context.get('source_content')
-
-        prompt = PROMPT_FACT_CHECKER_V1.format(
-            script=script[:2000],
-            source_content=source_content[:1000]
-        )
-        
-        verification = self.llm_client.complete(prompt)
-        context['verification_notes'] = verification
-        self.log(f"Fact check complete: {verification[:50]}...")
+        script = context.get('script') or ''
+        source_content = context.get('source_content') or ''
+
+        claims = self.extract_claims(script)
+        if not claims or not source_content.strip():
+            context['claim_verdicts'] = []
+            context['verification_notes'] = "Verified: no checkable claims." if not claims else "Not verified: no source content."
+            self.log(context['verification_notes'])
+            return context
+
+        index = self.get_source_index(source_content)
+        claim_embs = self.llm_client.embed_batch(claims)
+        evidence = [index.search(emb, self.passages_per_claim) for emb in claim_embs]
+
+        batches = [list(range(start, min(start + self.claims_per_call, len(claims))))
+                   for start in range(0, len(claims), self.claims_per_call)]
+        # Each call checks a few claims, so latency stays flat as the script grows
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as executor:
+            results = list(executor.map(lambda batch: self.check_batch(claims, evidence, batch), batches))
+
+        errors = [error for _, error in results if error is not None]
+        if len(errors) == len(results):
+            # Nothing was checked (e.g. the LLM is down): fail so the job can be resumed
+            raise errors[0]
+        verdicts = [verdict for batch_verdicts, _ in results for verdict in batch_verdicts]
+        context['claim_verdicts'] = verdicts
+        context['verification_notes'] = self.format_notes(verdicts)
+        self.log(f"Fact check complete: {context['verification_notes'].splitlines()[0]}")
         return context
+
+    def extract_claims(self, script):
+        """Declarative sentences of the script, without speaker labels, in order."""
+        claims = []
+        seen = set()
+        for line in script.split("\n"):
+            line = SPEAKER_PATTERN.sub("", line).strip()
+            for sentence in split_sentences(line):
+                sentence = sentence.strip()
+                key = sentence.lower()
+                if sentence.endswith("?") or len(sentence.split()) < self.min_claim_words or key in seen:
+                    continue
+                seen.add(key)
+                claims.append(sentence)
+        return claims[:self.max_claims]
+
+    def get_source_index(self, source_content, cancel=None):
+        return self.source_indexes.get_or_build(
+            source_content, lambda content: SourceIndex(self.llm_client, content, cancel=cancel))
+
+    def check_batch(self, claims, evidence, batch):
+        """:return: (one verdict dict per claim in `batch`, the exception if the call failed)"""
+        budget = self.max_evidence_tokens // len(batch)
+        blocks = []
+        passages = []
+        for number, i in enumerate(batch, 1):
+            scored = [(score, text) for text, score in evidence[i]]
+            chosen = [text for _, text in sorted(self.packer.select(scored, budget))]
+            passages.append(chosen)
+            lines = "\n".join(f"  - {text}" for text in chosen) or "  (no matching passage)"
+            blocks.append(f"Claim {number}: {claims[i]}\nPassages:\n{lines}")
+
+        error = None
+        try:
+            response = self.llm_client.complete(PROMPT_FACT_CHECKER_V2.format(claims="\n\n".join(blocks)))
+            parsed = self.parse_verdicts(response)
+        except Exception as e:
+            self.log(f"Verification call failed: {e}")
+            error = e
+            parsed = {}
+
+        verdicts = []
+        for number, i in enumerate(batch, 1):
+            verdict, note = parsed.get(number, ('unchecked', ''))
+            verdicts.append({'claim': claims[i], 'verdict': verdict, 'note': note, 'evidence': passages[number - 1]})
+        return verdicts, error
+
+    def parse_verdicts(self, response):
+        """:return: {claim number: (verdict, note)} for the well-formed entries"""
+        text = response or ""
+        data = loads_or_none(text.strip())
+        if not isinstance(data, dict):
+            data = largest_top_level(text, scan_objects(text), lambda d: "verdicts" in d)
+        if not data or not isinstance(data.get("verdicts"), list):
+            return {}
+        parsed = {}
+        for item in data["verdicts"]:
+            if not isinstance(item, dict):
+                continue
+            try:
+                number = int(item.get("claim"))
+            except (TypeError, ValueError):
+                continue
+            verdict = str(item.get("verdict", "")).strip().lower()
+            if verdict in VERDICTS:
+                parsed[number] = (verdict, str(item.get("note") or "").strip())
+        return parsed
+
+    def format_notes(self, verdicts):
+        counts = {verdict: 0 for verdict in VERDICTS + ('unchecked',)}
+        for v in verdicts:
+            counts[v['verdict']] += 1
+        if counts['supported'] == len(verdicts):
+            return f"Verified: all {len(verdicts)} claims are supported by the source."
+        summary = ", ".join(f"{count} {verdict}" for verdict, count in counts.items() if count)
+        issues = [f"- [{v['verdict']}] {v['claim']}" + (f" ({v['note']})" if v['note'] else "")
+                  for v in verdicts if v['verdict'] != 'supported']
+        return f"Checked {len(verdicts)} claims: {summary}.\n" + "\n".join(issues)
@@ -1,14 +1,20 @@
 from .base_agent import BaseAgent
 from prompts import PROMPT_PLANNING_V1
+from context_packer import ContextPacker, PROMPT_BUDGETS
 
 class PlanningAgent(BaseAgent):
-    def __init__(self, llm_client):
+    reads = ('topic', 'source_content')
+    writes = ('plan',)
+
+    def __init__(self, llm_client, max_source_tokens=PROMPT_BUDGETS['planning_source']):
         super().__init__("PlanningAgent", llm_client)
+        self.packer = ContextPacker(llm_client)
+        self.max_source_tokens = max_source_tokens
 
     def execute(self, context):
         self.log("Analyzing request and creating a podcast plan...")
         topic = context.get('topic')
-        source_preview = context.get('source_content', '')[:1000]
+        source_preview = self.packer.pack_text(context.get('source_content', ''), self.max_source_tokens, query=topic)
 
         prompt = PROMPT_PLANNING_V1.format(topic=topic, source_preview=source_preview)
         
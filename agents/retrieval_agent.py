@@ -1,19 +1,123 @@
+import re
 from .base_agent import BaseAgent
+from graph_rag import SimpleGraphRAG
+from index_cache import index_cache
+from text_utils import count_tokens
+from context_packer import ContextPacker
+
+TALKING_POINT_PATTERN = re.compile(r'^\s*\d+[.)]\s*(.+)$', re.MULTILINE)
 
 class RetrievalAgent(BaseAgent):
-    def __init__(self, llm_client):
+    reads = ('source_content', 'topic', 'plan')
+    writes = ('retrieved_context',)
+
+    def __init__(self, llm_client, max_context_tokens=1500, top_k_entities=5, top_k_communities=3):
         super().__init__("RetrievalAgent", llm_client)
+        self.max_context_tokens = max_context_tokens
+        self.top_k_entities = top_k_entities
+        self.top_k_communities = top_k_communities
+        self.index_cache = index_cache
+        self.packer = ContextPacker(llm_client)
 
     def execute(self, context):
         self.log("Retrieving relevant information...")
-        # In a real scenario, this would use the GraphRAG system to query the knowledge graph.
-        # For now, we'll pass the source content through, maybe summarizing it if it's too long.
-        
         source_content = context.get('source_content', '')
-        
-        # Simulate "retrieval" by selecting key segments or just passing it all if small.
-        # Let's pretend we found the most relevant chunks.
-        
-        context['retrieved_context'] = source_content # Pass-through for this demo
-        self.log("Context retrieved.")
+        topic = context.get('topic') or ''
+
+        # Short sources fit the budget as-is; indexing them would only cost LLM calls.
+        if not self.needs_index(source_content):
+            context['retrieved_context'] = source_content
+            self.log("Source fits the context budget, passing it through.")
+            return context
+
+        try:
+            graphrag = self.get_index(source_content)
+        except Exception as e:
+            self.log(f"GraphRAG indexing failed: {e}. Falling back to packed source sentences.")
+            context['retrieved_context'] = self.packer.pack_text(source_content, self.max_context_tokens, query=topic)
+            return context
+
+        queries = [topic] + self.talking_points(context.get('plan') or '')
+        candidates = self.collect_candidates(graphrag, [q for q in queries if q.strip()])
+        packed = self.pack(candidates)
+        if not packed:
+            # E.g. extraction found nothing: the script still needs the source
+            self.log("Index has nothing to retrieve. Falling back to packed source sentences.")
+            context['retrieved_context'] = self.packer.pack_text(source_content, self.max_context_tokens, query=topic)
+            return context
+        context['retrieved_context'] = packed
+        self.log(f"Context retrieved from {sum(len(items) for items in candidates.values())} ranked candidates.")
         return context
+
+    def needs_index(self, source_content):
+        return count_tokens(source_content or '') > self.max_context_tokens
+
+    def get_index(self, source_content, cancel=None):
+        # Jobs on the same source share one build through the process-wide cache
+        return self.index_cache.get_or_build(source_content, lambda content: self.build_index(content, cancel))
+
+    def build_index(self, source_content, cancel=None):
+        self.log("Building GraphRAG index for source...")
+        graphrag = SimpleGraphRAG(self.llm_client)
+        graphrag.insert([source_content], cancel=cancel)
+        return graphrag
+
+    def talking_points(self, plan):
+        return [p.strip(' []') for p in TALKING_POINT_PATTERN.findall(plan)]
+
+    def collect_candidates(self, graphrag, queries):
+        """
+        Score entity, relationship, community and source-chunk snippets against every query.
+        :return: dict of section -> {text: best score}
+        """
+        engine = graphrag.query_engine
+        graph = graphrag.graph
+        candidates = {'themes': {}, 'entities': {}, 'relationships': {}, 'passages': {}}
+
+        def offer(section, text, score):
+            if score > candidates[section].get(text, float('-inf')):
+                candidates[section][text] = score
+
+        for query in queries:
+            query_emb = self.llm_client.embed(query)
+
+            for comm_id, score in engine.rank_communities(query_emb, self.top_k_communities):
+                offer('themes', engine.community_summaries[comm_id].strip(), score)
+
+            ranked = dict(engine.rank_entities(query_emb, self.top_k_entities))
+            chunk_scores = {}
+            for name, score in ranked.items():
+                e = graph.entities[name]
+                offer('entities', f"- {name} ({e.type}): {e.description}", score)
+                for chunk_id in e.source_chunks:
+                    chunk_scores[chunk_id] = chunk_scores.get(chunk_id, 0.0) + score
+
+            for rel in graph.relationships_of(ranked):
+                if rel.source in ranked or rel.target in ranked:
+                    # Edges between two seed entities rank above edges leaving the seed set
+                    score = (ranked.get(rel.source, 0.0) + ranked.get(rel.target, 0.0)) / 2
+                    offer('relationships', f"- {rel.source} → {rel.target}: {rel.description}", score)
+
+            for chunk_id, score in chunk_scores.items():
+                offer('passages', graphrag.chunks[chunk_id].strip(), score / len(ranked))
+
+        return candidates
+
+    def pack(self, candidates):
+        headings = {
+            'themes': "Themes",
+            'entities': "Key entities",
+            'relationships': "Relationships",
+            'passages': "Source passages"
+        }
+        budget = self.max_context_tokens - sum(count_tokens(h) + 1 for h in headings.values())
+
+        flat = [(section, text, score) for section, items in candidates.items() for text, score in items.items()]
+        chosen = self.packer.select([(score, text) for _, text, score in flat], budget)
+
+        selected = {section: [] for section in candidates}
+        for i, text in chosen:
+            selected[flat[i][0]].append(text)
+
+        parts = [f"{headings[section]}:\n" + "\n".join(items) for section, items in selected.items() if items]
+        return "\n\n".join(parts)
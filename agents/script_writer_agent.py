@@ -1,25 +1,54 @@
 from .base_agent import BaseAgent
 from prompts import PROMPT_SCRIPT_WRITER_V1
+from context_packer import ContextPacker, PROMPT_BUDGETS
 
 class ScriptWriterAgent(BaseAgent):
-    def __init__(self, llm_client):
+    reads = ('topic', 'plan', 'retrieved_context', 'voice', '_script_stream')
+    writes = ('script',)
+
+    def __init__(self, llm_client, max_context_tokens=PROMPT_BUDGETS['script_context']):
         super().__init__("ScriptWriterAgent", llm_client)
+        self.packer = ContextPacker(llm_client)
+        self.max_context_tokens = max_context_tokens
 
     def execute(self, context):
         self.log("Drafting the podcast script...")
         topic = context.get('topic')
         plan = context.get('plan')
-        retrieved_context = context.get('retrieved_context')
+        retrieved_context = context.get('retrieved_context') or ''
         voice = context.get('voice', 'casual')
 
+        # Retrieval output is already budgeted; this guards pass-through sources
+        retrieved_context = self.packer.pack_text(
+            retrieved_context,
+            self.max_context_tokens,
+            query=f"{topic}\n{plan}",
+            by_lines=True
+        )
+
         prompt = PROMPT_SCRIPT_WRITER_V1.format(
             voice=voice,
             topic=topic,
             plan=plan,
-            retrieved_context=retrieved_context[:3000]
+            retrieved_context=retrieved_context
         )
         
-        script = self.llm_client.complete(prompt)
+        stream = context.get('_script_stream')
+        if stream is not None and hasattr(self.llm_client, 'complete_stream'):
+            script = self.write_streaming(prompt, stream)
+        else:
+            script = self.llm_client.complete(prompt)
         context['script'] = script
         self.log("Script drafted.")
         return context
+
+    def write_streaming(self, prompt, stream):
+        # Lines go out to TTS as soon as they are complete
+        try:
+            for delta in self.llm_client.complete_stream(prompt):
+                stream.write(delta)
+        except Exception as e:
+            stream.close(error=e)
+            raise
+        stream.close()
+        return stream.text()
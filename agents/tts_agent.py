@@ -1,28 +1,142 @@
 from .base_agent import BaseAgent
+import re
 import uuid
 import os
+import threading
+from concurrent.futures import Future
 from gtts import gTTS
 
+SPEAKABLE = re.compile(r"\w")
+
 class TTSAgent(BaseAgent):
-    def __init__(self, llm_client, output_folder):
+    reads = ('script', '_script_stream')
+    writes = ('audio_path', 'audio_url')
+
+    def __init__(self, llm_client, output_folder, segment_chars=600):
         super().__init__("TTSAgent", llm_client)
         self.output_folder = output_folder
+        # Upper bound on the text of one streamed segment (a longer line stays whole)
+        self.segment_chars = segment_chars
 
     def execute(self, context):
         self.log("Converting script to audio...")
         script = context.get('script')
-        
-        # Real TTS using Google Text-to-Speech
-        # Note: This requires an internet connection
-        tts = gTTS(text=script, lang='en', slow=False)
-        
-        audio_id = str(uuid.uuid4())
-        audio_filename = f"{audio_id}.mp3"
-        output_path = os.path.join(self.output_folder, audio_filename)
-        
-        tts.save(output_path)
-            
+
+        output_path = self.stitch_streamed(context.get('_script_stream'), script)
+        if output_path is None:
+            # Real TTS using Google Text-to-Speech
+            # Note: This requires an internet connection
+            tts = gTTS(text=script, lang='en', slow=False)
+
+            audio_id = str(uuid.uuid4())
+            audio_filename = f"{audio_id}.mp3"
+            output_path = os.path.join(self.output_folder, audio_filename)
+
+            tts.save(output_path)
+
+        audio_filename = os.path.basename(output_path)
         context['audio_path'] = output_path
         context['audio_url'] = f"/outputs/{audio_filename}"
         self.log(f"Audio generated at {output_path}")
         return context
+
+    def start_streaming(self, stream, on_segment=None):
+        """
+        Synthesize a ScriptStream's lines while the script is still being written.
+        The returned future (also stored as stream.audio) resolves to
+        (audio_id, segment paths in script order).
+        """
+        # A thread of its own: the consumer mostly waits on the writer, and a shared
+        # pool would let other jobs' waiting consumers hold up this one
+        future = Future()
+
+        def consume():
+            try:
+                future.set_result(self.synthesize_stream(stream, on_segment))
+            except Exception as e:
+                future.set_exception(e)
+
+        stream.audio = future
+        threading.Thread(target=consume, name="tts-stream", daemon=True).start()
+        return future
+
+    def synthesize_stream(self, stream, on_segment=None):
+        audio_id = str(uuid.uuid4())
+        paths = []
+        read = 0
+        try:
+            while True:
+                lines = stream.read(read)
+                if not lines:
+                    break
+                read += len(lines)
+                # Take every line that is ready, so segments grow once TTS falls behind
+                for text in self.group_lines(lines):
+                    if not SPEAKABLE.search(text):
+                        continue
+                    path = os.path.join(self.output_folder, f"{audio_id}_seg{len(paths):03d}.mp3")
+                    gTTS(text=text, lang='en', slow=False).save(path)
+                    paths.append(path)
+                    if on_segment:
+                        on_segment(f"/outputs/{os.path.basename(path)}")
+        except Exception:
+            # execute() synthesizes the whole script instead; the partial segments are of no use
+            self.remove_segments(paths)
+            raise
+        return audio_id, paths
+
+    def discard_segments(self, stream):
+        """Delete a stream's segment files once its consumer is done; the stitched file replaces them."""
+        if stream is None or stream.audio is None:
+            return
+        stream.audio.add_done_callback(
+            lambda future: future.exception() is None and self.remove_segments(future.result()[1]))
+
+    def remove_segments(self, paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def group_lines(self, lines):
+        groups = []
+        current = []
+        size = 0
+        for line in lines:
+            if current and size + len(line) > self.segment_chars:
+                groups.append("\n".join(current))
+                current = []
+                size = 0
+            current.append(line)
+            size += len(line) + 1
+        if current:
+            groups.append("\n".join(current))
+        return groups
+
+    def stitch_streamed(self, stream, script):
+        """
+        Join the streamed segments into one MP3 when they cover this script.
+        :return: path of the joined file, or None to synthesize the script whole
+        """
+        if stream is None or stream.audio is None or stream.error is not None:
+            return None
+        if stream.text().strip() != (script or '').strip():
+            return None
+        try:
+            audio_id, paths = stream.audio.result()
+        except Exception as e:
+            self.log(f"Streamed synthesis failed: {e}. Synthesizing the full script.")
+            return None
+        if not paths:
+            return None
+
+        # MP3 is a sequence of independent frames, so the segments concatenate
+        # byte-wise (gTTS writes its own multi-part output the same way)
+        output_path = os.path.join(self.output_folder, f"{audio_id}.mp3")
+        with open(output_path, 'wb') as out:
+            for path in paths:
+                with open(path, 'rb') as f:
+                    out.write(f.read())
+        self.log(f"Stitched {len(paths)} streamed segments.")
+        return output_path
@@ -0,0 +1,209 @@
+import numpy as np
+
+class VectorIndex:
+    """
+    Cosine-similarity index over keyed vectors with incremental add/remove.
+    Searches are exact until the index holds `min_train` vectors; past that an
+    inverted-file (IVF) layer is trained with spherical k-means and a query only
+    scans the vectors in its `n_probe` closest lists.
+    """
+    def __init__(self, n_lists=None, n_probe=16, min_train=4096, kmeans_iters=10, seed=42):
+        self.n_lists = n_lists # None: about sqrt(size) lists
+        self.n_probe = n_probe
+        self.min_train = min_train
+        self.kmeans_iters = kmeans_iters
+        self.seed = seed
+
+        self.vectors = None # unit vectors, one row per slot; grows by doubling
+        self.keys = [] # slot -> key, None for a free slot
+        self.tags = [] # slot -> caller-defined tag (e.g. a content hash)
+        self.slot_of = {} # key -> slot
+        self.free = []
+
+        self.centroids = None
+        self.list_of = np.empty(0, dtype=np.int32) # slot -> IVF list, -1 when free or unassigned
+        self.lists = [] # IVF list -> set of slots
+        self._list_arrays = {}
+        self.trained_size = 0
+
+    def __len__(self):
+        return len(self.slot_of)
+
+    def __contains__(self, key):
+        return key in self.slot_of
+
+    def tag(self, key):
+        slot = self.slot_of.get(key)
+        return None if slot is None else self.tags[slot]
+
+    def add(self, keys, vectors, tags=None):
+        """Insert or replace vectors; `keys` and `vectors` are parallel."""
+        vectors = self._normalize(vectors)
+        if len(keys) == 0:
+            return
+        self._reserve(vectors.shape[1], len(keys))
+        for i, key in enumerate(keys):
+            tag = tags[i] if tags is not None else None
+            slot = self.slot_of.get(key)
+            if slot is None:
+                slot = self.free.pop() if self.free else len(self.keys)
+                if slot == len(self.keys):
+                    self.keys.append(key)
+                    self.tags.append(tag)
+                else:
+                    self.keys[slot] = key
+                    self.tags[slot] = tag
+                self.slot_of[key] = slot
+            else:
+                self.tags[slot] = tag
+                self._unassign(slot)
+            self.vectors[slot] = vectors[i]
+        if self.centroids is not None:
+            self._assign([self.slot_of[key] for key in keys])
+
+    def remove(self, keys):
+        for key in keys:
+            slot = self.slot_of.pop(key, None)
+            if slot is None:
+                continue
+            self._unassign(slot)
+            self.keys[slot] = None
+            self.tags[slot] = None
+            self.free.append(slot)
+
+    def search(self, query, top_k=10, n_probe=None, exact=False):
+        """:return: list of (key, cosine similarity), best first"""
+        if not self.slot_of or top_k <= 0:
+            return []
+        query = self._normalize(query)[0]
+        if self.centroids is None or len(self) > 4 * self.trained_size:
+            # Retrain as the index outgrows the lists it was trained for
+            self.train()
+
+        n_probe = n_probe or self.n_probe
+        if exact or self.centroids is None or n_probe >= len(self.lists):
+            # Scan every slot in place; free ones can never rank
+            slots = np.arange(len(self.keys))
+            sims = self.vectors[:len(self.keys)] @ query
+            sims[self.free] = -np.inf
+        else:
+            nearest = np.argsort(-(self.centroids @ query))[:n_probe]
+            slots = np.concatenate([self._list_array(l) for l in nearest.tolist()])
+            sims = self.vectors[slots] @ query
+
+        top_k = min(top_k, len(self), len(slots))
+        if top_k == 0:
+            return []
+        if len(slots) > top_k:
+            best = np.argpartition(-sims, top_k - 1)[:top_k]
+        else:
+            best = np.arange(len(slots))
+        best = best[np.argsort(-sims[best], kind="stable")]
+        return [(self.keys[slots[i]], float(sims[i])) for i in best.tolist()]
+
+    def similarities(self, keys, query):
+        """:return: cosine similarity of `query` to each key's vector, 0.0 for keys not in the index"""
+        query = self._normalize(query)[0]
+        slots = [self.slot_of.get(key, -1) for key in keys]
+        present = [i for i, slot in enumerate(slots) if slot >= 0]
+        sims = np.zeros(len(keys), dtype=np.float32)
+        if present:
+            sims[present] = self.vectors[[slots[i] for i in present]] @ query
+        return sims
+
+    def train(self):
+        """(Re)build the IVF lists with k-means over the current vectors."""
+        size = len(self)
+        if size < self.min_train:
+            self.centroids = None
+            return
+        slots = np.fromiter(self.slot_of.values(), dtype=np.int64, count=size)
+        n_lists = self.n_lists or max(1, int(np.sqrt(size)))
+        rng = np.random.default_rng(self.seed)
+
+        # k-means on a sample is enough to place the centroids
+        sample = self.vectors[rng.choice(slots, min(size, 64 * n_lists), replace=False)]
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)]
+        for _ in range(self.kmeans_iters):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # Empty clusters keep their previous centroid
+            centroids = np.where(norms > 0, sums / np.where(norms == 0, 1, norms), centroids)
+
+        self.centroids = centroids.astype(np.float32)
+        self.lists = [set() for _ in range(n_lists)]
+        self._list_arrays = {}
+        self.list_of = np.full(len(self.keys), -1, dtype=np.int32)
+        self._assign(slots.tolist())
+        self.trained_size = size
+
+    def save(self, path):
+        slots = list(self.slot_of.values())
+        np.savez(
+            path,
+            vectors=self.vectors[slots] if slots else np.empty((0, 0), dtype=np.float32),
+            keys=np.array([self.keys[s] for s in slots], dtype=str),
+            tags=np.array(["" if self.tags[s] is None else self.tags[s] for s in slots], dtype=str),
+            centroids=self.centroids if self.centroids is not None else np.empty((0, 0), dtype=np.float32),
+            params=np.array([self.n_lists or 0, self.n_probe, self.min_train, self.trained_size])
+        )
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path, allow_pickle=False)
+        n_lists, n_probe, min_train, trained_size = data["params"].tolist()
+        index = cls(n_lists=n_lists or None, n_probe=n_probe, min_train=min_train)
+        keys = data["keys"].tolist()
+        tags = [t or None for t in data["tags"].tolist()]
+        if len(data["centroids"]):
+            # Reuse the saved centroids instead of retraining
+            index.centroids = data["centroids"]
+            index.lists = [set() for _ in range(len(index.centroids))]
+            index.trained_size = trained_size
+        index.add(keys, data["vectors"], tags)
+        return index
+
+    def _normalize(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors[None, :]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def _reserve(self, dim, extra):
+        needed = len(self.keys) + max(0, extra - len(self.free))
+        if self.vectors is None:
+            self.vectors = np.empty((max(needed, 1024), dim), dtype=np.float32)
+        elif needed > len(self.vectors):
+            grown = np.empty((max(needed, 2 * len(self.vectors)), dim), dtype=np.float32)
+            grown[:len(self.vectors)] = self.vectors
+            self.vectors = grown
+
+    def _assign(self, slots):
+        if not slots:
+            return
+        slots = np.asarray(slots, dtype=np.int64)
+        labels = np.argmax(self.vectors[slots] @ self.centroids.T, axis=1)
+        if len(self.list_of) < len(self.vectors):
+            self.list_of = np.concatenate([self.list_of, np.full(len(self.vectors) - len(self.list_of), -1, dtype=np.int32)])
+        for slot, label in zip(slots.tolist(), labels.tolist()):
+            self.list_of[slot] = label
+            self.lists[label].add(slot)
+            self._list_arrays.pop(label, None)
+
+    def _unassign(self, slot):
+        if self.centroids is None or slot >= len(self.list_of) or self.list_of[slot] < 0:
+            return
+        label = int(self.list_of[slot])
+        self.lists[label].discard(slot)
+        self._list_arrays.pop(label, None)
+        self.list_of[slot] = -1
+
+    def _list_array(self, label):
+        array = self._list_arrays.get(label)
+        if array is None:
+            members = self.lists[label]
+            array = self._list_arrays[label] = np.fromiter(members, dtype=np.int64, count=len(members))
+        return array
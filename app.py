@@ -1,5 +1,7 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import Flask, render_template, request, jsonify
 from orchestrator import Orchestrator
+from audio_server import AudioServer
+from source_prewarm import SourcePrewarmer
 import os
 import uuid
 import json
@@ -10,13 +12,35 @@ print("DEBUG: app.py is starting...")
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['OUTPUT_FOLDER'] = 'outputs'
+# Low-bitrate preview renditions for scrubbing (needs ffmpeg)
+app.config['AUDIO_PREVIEWS'] = os.getenv('AUDIO_PREVIEWS', '0') == '1'
 
 # Ensure directories exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['OUTPUT_FOLDER'], exist_ok=True)
 
+# Jobs are shared through jobs.db, so status can be polled on any web worker.
+# JOB_RUNNER=worker leaves running them to `python worker.py` processes.
+app.config['JOB_RUNNER'] = os.getenv('JOB_RUNNER', 'inline')
+
 # Initialize Orchestrator
-orchestrator = Orchestrator(app.config['OUTPUT_FOLDER'])
+orchestrator = Orchestrator(app.config['OUTPUT_FOLDER'], run_jobs=app.config['JOB_RUNNER'] == 'inline')
+audio_server = AudioServer(app.config['OUTPUT_FOLDER'], make_previews=app.config['AUDIO_PREVIEWS'])
+# Uploaded sources are indexed while the user picks a topic and voice. The caches
+# live in this process, so this only helps when jobs also run here.
+prewarmer = SourcePrewarmer(
+    orchestrator.prewarm_source,
+    max_workers=int(os.getenv('PREWARM_WORKERS', '1')),
+    ttl=int(os.getenv('PREWARM_TTL', '900'))
+) if orchestrator.run_jobs else None
+
+# Pick up jobs a previous process left unfinished. Under the debug reloader only
+# the child process that serves requests does; claims keep other workers from
+# resuming the same job.
+if orchestrator.run_jobs and (__name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+    resumed = orchestrator.resume_interrupted(max_jobs=int(os.getenv('RESUME_JOBS', '2')))
+    if resumed:
+        print(f"Resumed {len(resumed)} interrupted job(s): {resumed}")
 
 # In-memory storage for history (in a real app, use a database)
 HISTORY_FILE = 'history.json'
@@ -42,6 +66,7 @@ def upload_source():
     
     source_id = str(uuid.uuid4())
     content = ""
+    readable = True
     
     if 'file' in request.files:
         file = request.files['file']
@@ -55,10 +80,18 @@ def upload_source():
                 content = f.read()
         except:
             content = f"File uploaded: {file.filename}"
+            readable = False
     else:
         content = request.form['text']
+    
+    prewarm = prewarmer.submit(source_id, content) if prewarmer and readable else 'disabled'
         
-    return jsonify({'source_id': source_id, 'content_preview': content[:200] + "...", 'full_content': content})
+    return jsonify({'source_id': source_id, 'content_preview': content[:200] + "...", 'full_content': content, 'prewarm': prewarm})
+
+@app.route('/upload-source/<source_id>/cancel', methods=['POST'])
+def cancel_source(source_id):
+    # The user replaced or abandoned the source before generating from it
+    return jsonify({'cancelled': bool(prewarmer and prewarmer.cancel(source_id))})
 
 @app.route('/generate-podcast', methods=['POST'])
 def generate_podcast():
@@ -66,6 +99,10 @@ def generate_podcast():
     source_content = data.get('source_content')
     topic = data.get('topic')
     voice = data.get('voice')
+    force = bool(data.get('force', False))
+    if prewarmer and data.get('source_id'):
+        # Keep its pre-indexing running for this job instead of expiring it
+        prewarmer.release(data['source_id'])
     
     context = {
         'source_content': source_content,
@@ -73,7 +110,7 @@ def generate_podcast():
         'voice': voice
     }
     
-    job_id = orchestrator.start_job(context)
+    job_id = orchestrator.start_job(context, force=force)
     return jsonify({'job_id': job_id})
 
 @app.route('/podcast/status/<job_id>', methods=['GET'])
@@ -85,13 +122,21 @@ def get_status(job_id):
     response = {
         'status': status['status'],
         'current_step': status['current_step'],
+        'running_steps': status.get('running_steps', []),
         'steps_completed': status['steps_completed'],
+        'audio_segments': status.get('audio_segments', []),
         'result': status['result'],
         'error': status['error']
     }
+    if status['status'] == 'completed' and status['result']:
+        preview_url = audio_server.preview_url(status['result'].get('audio_url'))
+        if preview_url:
+            response['result'] = dict(status['result'], preview_url=preview_url)
     
     # If completed, save to history (simple hack for this demo)
-    if status['status'] == 'completed' and not status.get('saved', False):
+    # Reused results are already in the history under the job that produced them.
+    # Any worker may answer the poll; mark_saved lets only one of them save it.
+    if status['status'] == 'completed' and not status.get('reused_from') and orchestrator.mark_saved(job_id):
         podcast_data = {
             'id': job_id,
             'topic': status['context'].get('topic'),
@@ -99,13 +144,23 @@ def get_status(job_id):
             'script': status['result']['script'],
             'audio_url': status['result']['audio_url']
         }
+        audio_server.schedule_preview(podcast_data['audio_url'])
+        preview_url = audio_server.preview_url(podcast_data['audio_url'])
+        if preview_url:
+            podcast_data['preview_url'] = preview_url
         history = load_history()
         history.insert(0, podcast_data)
         save_history(history)
-        status['saved'] = True # Prevent double saving
         
     return jsonify(response)
 
+@app.route('/podcast/resume/<job_id>', methods=['POST'])
+def resume_podcast(job_id):
+    job = orchestrator.resume_job(job_id)
+    if not job:
+        return jsonify({'error': 'No failed or interrupted job to resume'}), 404
+    return jsonify({'job_id': job_id, 'steps_completed': job['steps_completed']})
+
 @app.route('/podcast/<id>', methods=['GET'])
 def get_podcast(id):
     history = load_history()
@@ -120,7 +175,7 @@ def get_history():
 
 @app.route('/outputs/<path:filename>')
 def download_file(filename):
-    return send_from_directory(app.config['OUTPUT_FOLDER'], filename)
+    return audio_server.serve(filename, request, preview=request.args.get('preview') == '1')
 
 if __name__ == '__main__':
     app.run(debug=True)
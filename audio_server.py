@@ -0,0 +1,190 @@
+import os
+import re
+import mmap
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate, parsedate_to_datetime
+from flask import Response, abort
+from werkzeug.security import safe_join
+from werkzeug.wsgi import wrap_file
+
+logger = logging.getLogger("AudioServer")
+
+# Outputs are written once under a fresh UUID and never modified afterwards,
+# so browsers and proxies may keep them for as long as they like.
+IMMUTABLE_NAME = re.compile(
+    r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}(_mixed|_preview|_seg\d+)?\.(mp3|wav)$'
+)
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+DEFAULT_CACHE_CONTROL = "public, max-age=60"
+NO_CACHE_CONTROL = "no-cache"
+BLOCK_SIZE = 64 * 1024
+MIME_TYPES = {'.mp3': 'audio/mpeg', '.wav': 'audio/wav'}
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def preview_name(filename):
+    stem, _ = os.path.splitext(filename)
+    return f"{stem}_preview.mp3"
+
+
+def parse_range(header, size):
+    """
+    Parse a single-range `Range` header.
+    :return: (start, end) inclusive, None to serve the whole file, or False if unsatisfiable.
+    """
+    if not header:
+        return None
+    match = RANGE_PATTERN.match(header.strip())
+    if not match:
+        # Multi-range and malformed requests fall back to a full 200 response.
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the final N bytes.
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
+def iter_mmap_range(path, start, end):
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            pos = start
+            while pos <= end:
+                stop = min(pos + BLOCK_SIZE, end + 1)
+                yield mm[pos:stop]
+                pos = stop
+
+
+class AudioServer:
+    def __init__(self, folder, make_previews=False, preview_bitrate="32k", preview_workers=1):
+        self.folder = folder
+        self.make_previews = make_previews
+        self.preview_bitrate = preview_bitrate
+        # Preview encoding runs off the request path on its own small pool.
+        self.preview_executor = ThreadPoolExecutor(max_workers=preview_workers) if make_previews else None
+        self.pending_previews = set() # filenames queued or being encoded
+        self.lock = threading.Lock()
+
+    def serve(self, filename, request, preview=False):
+        preview_missing = False
+        if preview:
+            candidate = preview_name(filename)
+            if os.path.exists(safe_join(self.folder, candidate) or ""):
+                filename = candidate
+            else:
+                preview_missing = True
+
+        path = safe_join(self.folder, filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+
+        st = os.stat(path)
+        size = st.st_size
+        etag = f'"{st.st_ino:x}-{st.st_mtime_ns:x}-{size:x}"'
+        last_modified = formatdate(st.st_mtime, usegmt=True)
+
+        if preview_missing:
+            # Stand-in for a preview still being encoded; the same URL serves the real one later
+            cache_control = NO_CACHE_CONTROL
+        elif IMMUTABLE_NAME.match(os.path.basename(filename)):
+            cache_control = IMMUTABLE_CACHE_CONTROL
+        else:
+            cache_control = DEFAULT_CACHE_CONTROL
+        headers = {
+            'ETag': etag,
+            'Last-Modified': last_modified,
+            'Accept-Ranges': 'bytes',
+            'Cache-Control': cache_control,
+        }
+        mimetype = MIME_TYPES.get(os.path.splitext(filename)[1].lower(), 'application/octet-stream')
+
+        if self._not_modified(request, etag, st.st_mtime):
+            return Response(status=304, headers=headers)
+
+        byte_range = parse_range(request.headers.get('Range'), size)
+        if_range = request.headers.get('If-Range')
+        if byte_range and if_range and if_range != etag and if_range != last_modified:
+            byte_range = None
+
+        if byte_range is False:
+            headers['Content-Range'] = f"bytes */{size}"
+            return Response(status=416, headers=headers)
+
+        if byte_range and size > 0:
+            start, end = byte_range
+            headers['Content-Range'] = f"bytes {start}-{end}/{size}"
+            headers['Content-Length'] = str(end - start + 1)
+            return Response(iter_mmap_range(path, start, end), status=206, headers=headers,
+                            mimetype=mimetype, direct_passthrough=True)
+
+        # Full responses go through wsgi.file_wrapper so servers that support it can use sendfile().
+        headers['Content-Length'] = str(size)
+        f = open(path, 'rb')
+        return Response(wrap_file(request.environ, f, BLOCK_SIZE), status=200, headers=headers,
+                        mimetype=mimetype, direct_passthrough=True)
+
+    def _not_modified(self, request, etag, mtime):
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match:
+            tags = [t.strip() for t in if_none_match.split(',')]
+            return '*' in tags or etag in tags or f"W/{etag}" in tags
+
+        if_modified_since = request.headers.get('If-Modified-Since')
+        if if_modified_since:
+            try:
+                return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def schedule_preview(self, audio_url):
+        """Queue a low-bitrate rendition of an output file for scrubbing."""
+        if not self.make_previews or not audio_url:
+            return None
+        filename = os.path.basename(audio_url)
+        source = safe_join(self.folder, filename)
+        target = safe_join(self.folder, preview_name(filename))
+        if source is None or target is None or os.path.exists(target):
+            return None
+        with self.lock:
+            # Several web threads may see the same job complete
+            if filename in self.pending_previews:
+                return None
+            self.pending_previews.add(filename)
+        return self.preview_executor.submit(self._render_preview, filename, source, target)
+
+    def preview_url(self, audio_url):
+        """URL of the preview rendition; serve() falls back to the full file until it is encoded."""
+        if not self.make_previews or not audio_url:
+            return None
+        return audio_url + '?preview=1'
+
+    def _render_preview(self, filename, source, target):
+        from pydub import AudioSegment
+
+        tmp_path = target + ".tmp"
+        try:
+            audio = AudioSegment.from_file(source).set_channels(1)
+            audio.export(tmp_path, format="mp3", bitrate=self.preview_bitrate)
+            os.replace(tmp_path, target)
+            logger.info(f"Preview rendered for {filename}")
+        except Exception as e:
+            logger.error(f"Preview rendering failed for {filename} (likely missing ffmpeg): {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        finally:
+            with self.lock:
+                self.pending_previews.discard(filename)
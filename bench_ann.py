@@ -0,0 +1,55 @@
+import argparse
+import time
+import numpy as np
+from ann_index import VectorIndex
+
+def synthetic_vectors(num_vectors, dim, num_topics=256, seed=42):
+    # Clustered like real description embeddings: topic centres plus noise
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((num_topics, dim)).astype(np.float32)
+    topics = rng.integers(0, num_topics, num_vectors)
+    return centres[topics] + 0.6 * rng.standard_normal((num_vectors, dim)).astype(np.float32)
+
+def timed_search(index, queries, top_k, **kwargs):
+    start = time.perf_counter()
+    results = [[key for key, _ in index.search(q, top_k, **kwargs)] for q in queries]
+    return results, (time.perf_counter() - start) / len(queries)
+
+def recall(results, truth):
+    hits = sum(len(set(r) & set(t)) for r, t in zip(results, truth))
+    return hits / sum(len(t) for t in truth)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall vs latency of the IVF entity index against exact search")
+    parser.add_argument("--vectors", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=384) # all-MiniLM-L6-v2
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"Generating {args.vectors:,} vectors of dimension {args.dim}...")
+    vectors = synthetic_vectors(args.vectors, args.dim)
+    queries = synthetic_vectors(args.queries, args.dim, seed=7)
+    keys = [f"Entity {i}" for i in range(args.vectors)]
+
+    index = VectorIndex()
+    start = time.perf_counter()
+    index.add(keys, vectors)
+    index.train()
+    print(f"Built index with {len(index.lists)} lists in {time.perf_counter() - start:.1f}s")
+
+    truth, exact_time = timed_search(index, queries, args.top_k, exact=True)
+    print(f"\n{'n_probe':>8} {'recall@' + str(args.top_k):>10} {'ms/query':>10} {'speedup':>8}")
+    print(f"{'exact':>8} {1.0:>10.3f} {exact_time * 1000:>10.2f} {1.0:>7.1f}x")
+    for n_probe in (1, 2, 4, 8, 16, 32, 64):
+        if n_probe >= len(index.lists):
+            break
+        results, ivf_time = timed_search(index, queries, args.top_k, n_probe=n_probe)
+        print(f"{n_probe:>8} {recall(results, truth):>10.3f} {ivf_time * 1000:>10.2f} {exact_time / ivf_time:>7.1f}x")
+
+    # Incremental updates: replace 1% of the vectors, then remove them
+    changed = keys[:args.vectors // 100]
+    start = time.perf_counter()
+    index.add(changed, synthetic_vectors(len(changed), args.dim, seed=11))
+    index.remove(changed)
+    print(f"\nRe-added and removed {len(changed):,} vectors in {time.perf_counter() - start:.2f}s")
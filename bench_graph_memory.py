@@ -0,0 +1,86 @@
+import argparse
+import random
+import time
+import tracemalloc
+from graph_models import KnowledgeGraph
+
+# The entity/relationship classes as they were before compact storage,
+# kept here only as the benchmark baseline.
+class LegacyEntity:
+    def __init__(self, name, type, description, source_chunks=None):
+        self.name = name
+        self.type = type
+        self.description = description
+        self.source_chunks = source_chunks if source_chunks else set()
+
+class LegacyRelationship:
+    def __init__(self, source, target, description, weight=1):
+        self.source = source
+        self.target = target
+        self.description = description
+        self.weight = weight
+
+TYPES = ["Person", "Organization", "Location", "Event", "Concept"]
+RELATION_TEMPLATES = ["works with", "is part of", "located in", "founded", "competes with", "mentions"]
+
+def synthetic_data(num_entities, num_relationships, seed=42):
+    rng = random.Random(seed)
+    names = [f"Entity {i}" for i in range(num_entities)]
+    entities = [
+        (name, TYPES[i % len(TYPES)], f"{name} is a synthetic {TYPES[i % len(TYPES)].lower()}.", i // 10)
+        for i, name in enumerate(names)
+    ]
+    seen = set()
+    relationships = []
+    while len(relationships) < num_relationships:
+        a, b = rng.randrange(num_entities), rng.randrange(num_entities)
+        if a == b or (a, b) in seen:
+            continue
+        seen.add((a, b))
+        relationships.append((names[a], names[b], f"{rng.choice(RELATION_TEMPLATES)} (#{len(relationships)})"))
+    return entities, relationships
+
+def build_legacy(entities, relationships):
+    graph = {}
+    for name, type, description, chunk_id in entities:
+        graph[name] = LegacyEntity(name, type, description, {chunk_id})
+    # Endpoint names are copied per edge, as they were when parsed from extractor JSON
+    edges = [LegacyRelationship("".join(s), "".join(t), d) for s, t, d in relationships]
+    return graph, edges
+
+def build_compact(entities, relationships):
+    graph = KnowledgeGraph(resolve_names=False)
+    for name, type, description, chunk_id in entities:
+        graph.add_entity(name, type, description, chunk_id)
+    for source, target, description in relationships:
+        graph.add_relationship("".join(source), "".join(target), description)
+    return graph
+
+def measure(build, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build(*args)
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, peak, elapsed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare graph storage memory: legacy classes vs compact KnowledgeGraph")
+    parser.add_argument("--entities", type=int, default=100_000)
+    parser.add_argument("--relationships", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    print(f"Generating {args.entities:,} entities and {args.relationships:,} relationships...")
+    entities, relationships = synthetic_data(args.entities, args.relationships)
+
+    legacy, legacy_bytes, legacy_peak, legacy_time = measure(build_legacy, entities, relationships)
+    del legacy
+    compact, compact_bytes, compact_peak, compact_time = measure(build_compact, entities, relationships)
+
+    mb = 1024 * 1024
+    print(f"{'storage':<10}{'retained MB':>14}{'peak MB':>12}{'build s':>10}")
+    print(f"{'legacy':<10}{legacy_bytes / mb:>14.1f}{legacy_peak / mb:>12.1f}{legacy_time:>10.2f}")
+    print(f"{'compact':<10}{compact_bytes / mb:>14.1f}{compact_peak / mb:>12.1f}{compact_time:>10.2f}")
+    print(f"Compact storage uses {compact_bytes / legacy_bytes:.0%} of the legacy footprint")
+    print("Graph stats:", compact.stats())
@@ -0,0 +1,80 @@
+import re
+import zlib
+from collections import OrderedDict
+import numpy as np
+
+WORD_PATTERN = re.compile(r"\w+")
+# Mersenne prime 2^31 - 1: a * x + b stays below 2^63 for 32-bit shingle hashes
+PRIME = (1 << 31) - 1
+
+
+class ChunkDeduplicator:
+    """
+    Finds chunks that nearly repeat an earlier one (overlapping windows, shared
+    headers, footers and disclaimers) with MinHash signatures over word
+    shingles and an LSH index of signature bands. A candidate from the index
+    counts as a duplicate when its estimated Jaccard similarity reaches
+    `threshold`. At most `max_entries` chunks stay indexed, least recently
+    added or matched first out, so boilerplate that keeps repeating stays.
+    """
+    def __init__(self, threshold=0.85, num_perm=128, bands=16, shingle_words=5, seed=42, max_entries=2048):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_words = shingle_words
+        self.max_entries = max_entries
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, PRIME, num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, PRIME, num_perm, dtype=np.uint64)
+
+        self.signatures = OrderedDict() # chunk_id -> signature, least recently used first
+        self.buckets = [{} for _ in range(bands)] # per band: band bytes -> chunk ids
+        self.stats = {"checked": 0, "duplicates": 0}
+
+    def shingles(self, text):
+        words = WORD_PATTERN.findall(text.lower())
+        n = self.shingle_words
+        if len(words) <= n:
+            grams = [" ".join(words)]
+        else:
+            grams = [" ".join(words[i:i + n]) for i in range(len(words) - n + 1)]
+        return np.unique(np.fromiter((zlib.crc32(g.encode('utf-8')) for g in grams), dtype=np.uint64, count=len(grams)))
+
+    def signature(self, text):
+        hashes = self.shingles(text) % np.uint64(PRIME)
+        return ((self.a[:, None] * hashes[None, :] + self.b[:, None]) % np.uint64(PRIME)).min(axis=1)
+
+    def find(self, signature):
+        """:return: (chunk_id, estimated similarity) of the closest indexed chunk at or above the threshold, or None"""
+        self.stats["checked"] += 1
+        candidates = set()
+        for band, buckets in enumerate(self.buckets):
+            candidates.update(buckets.get(self._band_key(signature, band), ()))
+        best = None
+        for chunk_id in candidates:
+            similarity = float(np.mean(self.signatures[chunk_id] == signature))
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (chunk_id, similarity)
+        if best is not None:
+            self.stats["duplicates"] += 1
+            self.signatures.move_to_end(best[0])
+        return best
+
+    def add(self, chunk_id, signature):
+        self.signatures[chunk_id] = signature
+        for band, buckets in enumerate(self.buckets):
+            buckets.setdefault(self._band_key(signature, band), []).append(chunk_id)
+        while len(self.signatures) > self.max_entries:
+            old_id, old_signature = self.signatures.popitem(last=False)
+            for band, buckets in enumerate(self.buckets):
+                key = self._band_key(old_signature, band)
+                bucket = buckets[key]
+                bucket.remove(old_id)
+                if not bucket:
+                    del buckets[key]
+
+    def _band_key(self, signature, band):
+        return signature[band * self.rows:(band + 1) * self.rows].tobytes()
@@ -5,20 +5,175 @@ from graph_models import KnowledgeGraph
 from entity_extractor import EntityExtractor
 from llm_client import SimpleLLMClient
 
+class CommunityHierarchy:
+    """
+    Nested community partitions, finest first. Each community at level L > 0 is
+    the union of its children at level L - 1; the last level is the flat
+    partition detect_communities returns.
+    """
+    def __init__(self, levels):
+        self.levels = levels # per level: {comm_id: [entity names]}
+        self.parents = [{} for _ in levels] # per level: {comm_id: parent id at level + 1}
+        self.children = [{} for _ in levels] # per level: {comm_id: [child ids at level - 1]}
+        self.summaries = [{} for _ in levels] # per level: {comm_id: summary}
+
+        for level in range(len(levels) - 1):
+            parent_of = {name: parent for parent, members in levels[level + 1].items() for name in members}
+            for comm_id, members in levels[level].items():
+                parent = parent_of[members[0]]
+                self.parents[level][comm_id] = parent
+                self.children[level + 1].setdefault(parent, []).append(comm_id)
+
+    @property
+    def top(self):
+        return len(self.levels) - 1
+
+    def communities(self, level=None):
+        if not self.levels:
+            return {}
+        return self.levels[self.top if level is None else level]
+
+    def summaries_at(self, level=None):
+        if not self.levels:
+            return {}
+        return self.summaries[self.top if level is None else level]
+
+    def stats(self):
+        return {
+            "levels": len(self.levels),
+            "communities_per_level": [len(level) for level in self.levels]
+        }
+
+def match_communities(fresh, previous, next_id, dirty, threshold=0.5):
+    """
+    Give re-detected communities the ids of the previous communities they overlap
+    most (Jaccard >= threshold), greedily from the best match down.
+    :param fresh: list of member lists
+    :param previous: {comm_id: members} they may inherit ids from
+    :return: ({comm_id: members}, set of ids that are new or whose members or contents changed)
+    """
+    owner = {name: comm_id for comm_id, members in previous.items() for name in members}
+    pairs = []
+    for i, members in enumerate(fresh):
+        overlap = {}
+        for name in members:
+            comm_id = owner.get(name)
+            if comm_id is not None:
+                overlap[comm_id] = overlap.get(comm_id, 0) + 1
+        for comm_id, shared in overlap.items():
+            jaccard = shared / (len(members) + len(previous[comm_id]) - shared)
+            if jaccard >= threshold:
+                pairs.append((jaccard, i, comm_id))
+
+    assigned = {}
+    taken = set()
+    for jaccard, i, comm_id in sorted(pairs, key=lambda p: (-p[0], p[1])):
+        if i not in assigned and comm_id not in taken:
+            assigned[i] = comm_id
+            taken.add(comm_id)
+
+    result = {}
+    changed = set()
+    for i, members in enumerate(fresh):
+        comm_id = assigned.get(i)
+        if comm_id is None:
+            comm_id = next_id
+            next_id += 1
+        result[comm_id] = members
+        if comm_id not in previous or set(members) != set(previous[comm_id]) or not dirty.isdisjoint(members):
+            changed.add(comm_id)
+    return result, changed
+
 class CommunityDetector:
+    def __init__(self, seed=42, max_affected=0.5, match_threshold=0.5):
+        self.seed = seed
+        # Share of nodes above which an update re-partitions the whole graph
+        self.max_affected = max_affected
+        self.match_threshold = match_threshold
+
     def detect_communities(self, graph):
+        return self.detect_hierarchy(graph).communities()
+
+    def detect_hierarchy(self, graph):
+        """Louvain partitions after each aggregation pass, as a CommunityHierarchy."""
         G = graph.to_networkx()
 
         if len(G.nodes()) == 0:
-            return {}
+            return CommunityHierarchy([])
+
+        levels = []
+        for partition in community.louvain_partitions(G, seed=self.seed):
+            levels.append({idx: list(comm) for idx, comm in enumerate(partition)})
+
+        return CommunityHierarchy(levels)
 
-        communities_list = community.louvain_communities(G, seed=42)
+    def update_hierarchy(self, graph, previous, dirty):
+        """
+        Bring `previous` up to date after the graph changed at the `dirty` nodes.
+        Only the top-level communities holding a dirty or new node are
+        re-partitioned, keeping their depth; the rest keep their members, ids and
+        summaries. Re-detected communities inherit the id of the previous community
+        they overlap most.
+        :return: (hierarchy, changed) where changed[level] is the set of community
+            ids at that level that need a new summary
+        """
+        G = graph.to_networkx()
+        if not previous.levels or len(G) == 0:
+            hierarchy = self.detect_hierarchy(graph)
+            return hierarchy, [set(level) for level in hierarchy.levels]
+
+        top = previous.communities()
+        top_of = {name: comm_id for comm_id, members in top.items() for name in members}
+        affected = {top_of[name] for name in dirty if name in top_of}
+        region = {name for comm_id in affected for name in top[comm_id]}
+        region.update(name for name in dirty if name in G)
+        region.update(name for name in G if name not in top_of)
+        region = {name for name in region if name in G}
+
+        full = len(region) > self.max_affected * len(G)
+        if full:
+            affected = set(top)
+            region = set(G)
 
-        communities_dict = {}
-        for idx, comm in enumerate(communities_list):
-            communities_dict[idx] = list(comm)
+        partitions = []
+        if region:
+            subgraph = G.subgraph(region)
+            # Scale the resolution so the region is partitioned as it would be inside
+            # the whole graph, not at its own (finer) modularity scale
+            total = G.size(weight="weight")
+            resolution = subgraph.size(weight="weight") / total if total else 1
+            partitions = list(community.louvain_partitions(subgraph, resolution=resolution, seed=self.seed))
+        depth = len(partitions) if full else len(previous.levels)
 
-        return communities_dict
+        levels = []
+        changed = []
+        for level in range(depth):
+            old = previous.levels[level] if level < len(previous.levels) else {}
+            # Communities outside the region are carried over as they were
+            current = {comm_id: members for comm_id, members in old.items() if top_of.get(members[0]) not in affected}
+            level_changed = set()
+            if partitions:
+                # A shallower region repeats its last partition; a deeper one skips to it at the top
+                index = len(partitions) - 1 if level == depth - 1 else min(level, len(partitions) - 1)
+                fresh, level_changed = match_communities(
+                    [list(comm) for comm in partitions[index]],
+                    {comm_id: members for comm_id, members in old.items() if comm_id not in current},
+                    max(old, default=-1) + 1,
+                    dirty,
+                    self.match_threshold
+                )
+                current.update(fresh)
+            levels.append(dict(sorted(current.items())))
+            changed.append(level_changed)
+
+        hierarchy = CommunityHierarchy(levels)
+        for level, communities in enumerate(levels):
+            if level >= len(previous.summaries):
+                break
+            for comm_id in communities:
+                if comm_id not in changed[level] and comm_id in previous.summaries[level]:
+                    hierarchy.summaries[level][comm_id] = previous.summaries[level][comm_id]
+        return hierarchy, changed
 
 if __name__ == "__main__":
     client = SimpleLLMClient()
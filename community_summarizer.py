@@ -2,6 +2,8 @@ from llm_client import SimpleLLMClient
 from graph_models import KnowledgeGraph
 from entity_extractor import EntityExtractor
 from community_detector import CommunityDetector
+from context_packer import ContextPacker, PROMPT_BUDGETS
+from text_utils import count_tokens
 
 COMMUNITY_SUMMARY_PROMPT = """
 Analyze this community of related entities from a knowledge graph.
@@ -20,11 +22,78 @@ Write a summary (200-300 words) that:
 Summary:
 """
 
+PARENT_SUMMARY_PROMPT = """
+These are summaries of the sub-communities that together form a larger community
+in a knowledge graph.
+
+{summaries}
+
+Write a summary (200-300 words) of the larger community that:
+1. Identifies the main theme connecting the sub-communities
+2. Explains how the sub-communities relate to each other
+3. Highlights key insights
+
+Summary:
+"""
+
 class CommunitySummarizer:
-    def __init__(self, llm_client):
+    def __init__(self, llm_client, max_context_tokens=PROMPT_BUDGETS['community_context']):
         self.llm_client = llm_client
+        self.max_context_tokens = max_context_tokens
+        self.packer = ContextPacker()
 
     def summarize_community(self, community_graph):
+        entity_text, rel_text = self.format_community(community_graph)
+
+        prompt = COMMUNITY_SUMMARY_PROMPT.format(
+            entities=entity_text,
+            relationships=rel_text
+        )
+
+        return self.llm_client.complete(prompt)
+
+    def summarize_children(self, child_summaries):
+        """Summarize a community from its sub-community summaries; earlier ones win when they do not all fit."""
+        blocks = [f"Sub-community {i + 1}:\n{summary.strip()}" for i, summary in enumerate(child_summaries)]
+        prompt = PARENT_SUMMARY_PROMPT.format(
+            summaries=self.packer.pack(blocks, self.max_context_tokens, separator="\n\n")
+        )
+        return self.llm_client.complete(prompt)
+
+    def summarize_hierarchy(self, graph, hierarchy, changed=None):
+        """
+        Fill hierarchy.summaries bottom-up. Finest communities are summarized from
+        their entities; a parent is summarized from its entities when they fit the
+        context budget, otherwise from its children's summaries.
+        :param changed: per level, the ids to (re)summarize; None summarizes everything
+        :return: number of LLM calls made
+        """
+        calls = 0
+        for level, communities in enumerate(hierarchy.levels):
+            summaries = hierarchy.summaries[level]
+            for comm_id, members in communities.items():
+                if changed is not None and comm_id not in changed[level] and comm_id in summaries:
+                    continue
+                children = hierarchy.children[level].get(comm_id, [])
+                if len(children) == 1:
+                    # Unchanged by this aggregation pass
+                    summaries[comm_id] = hierarchy.summaries[level - 1][children[0]]
+                    continue
+
+                subgraph = graph.get_subgraph(members)
+                entity_text, rel_text = self.format_community(subgraph)
+                if not children or count_tokens(entity_text) + count_tokens(rel_text) <= self.max_context_tokens:
+                    summaries[comm_id] = self.llm_client.complete(COMMUNITY_SUMMARY_PROMPT.format(
+                        entities=entity_text,
+                        relationships=rel_text
+                    ))
+                else:
+                    children = sorted(children, key=lambda c: -len(hierarchy.levels[level - 1][c]))
+                    summaries[comm_id] = self.summarize_children([hierarchy.summaries[level - 1][c] for c in children])
+                calls += 1
+        return calls
+
+    def format_community(self, community_graph):
         entity_lines = []
         for name, entity in community_graph.entities.items():
             entity_lines.append(f"- {name} ({entity.type}): {entity.description}")
@@ -35,12 +104,7 @@ class CommunitySummarizer:
             rel_lines.append(f"- {rel.source} → {rel.target}: {rel.description}")
         rel_text = "\n".join(rel_lines)
 
-        prompt = COMMUNITY_SUMMARY_PROMPT.format(
-            entities=entity_text,
-            relationships=rel_text
-        )
-
-        return self.llm_client.complete(prompt)
+        return entity_text, rel_text
 
 if __name__ == "__main__":
     client = SimpleLLMClient()
@@ -0,0 +1,100 @@
+import numpy as np
+from text_utils import count_tokens, split_sentences, TOKEN_PATTERN
+
+# Token budgets for the variable parts of each prompt. llama-3.3-70b-versatile
+# has a 128k window; these stay far below it to keep latency and cost down.
+PROMPT_BUDGETS = {
+    "planning_source": 1500,
+    "script_context": 3000,
+    "fact_check_evidence": 2500,
+    "local_entities": 1500,
+    "local_relationships": 1000,
+    "global_summaries": 3000,
+    "community_context": 3000,
+    "global_map": 2000,
+    "global_reduce": 3000,
+}
+
+# Candidate count above which a cheap lexical pass narrows the field before embedding
+MAX_EMBEDDED_CANDIDATES = 256
+
+
+def lexical_scores(query, candidates):
+    query_terms = {t.lower() for t in TOKEN_PATTERN.findall(query) if t.isalnum()}
+    scores = []
+    for text in candidates:
+        terms = {t.lower() for t in TOKEN_PATTERN.findall(text) if t.isalnum()}
+        scores.append(len(query_terms & terms) / (len(terms) ** 0.5) if terms else 0.0)
+    return np.array(scores, dtype=float)
+
+
+class ContextPacker:
+    """
+    Fill a token budget with the most relevant whole units (sentences, lines,
+    summaries) of a context, instead of slicing a fixed number of characters.
+    """
+    def __init__(self, llm_client=None):
+        self.llm_client = llm_client
+
+    def score(self, query, candidates):
+        if not candidates:
+            return np.zeros(0)
+        if not query:
+            # No query: prefer earlier units
+            return -np.arange(len(candidates), dtype=float)
+
+        scores = lexical_scores(query, candidates)
+        if self.llm_client is None:
+            return scores
+
+        # Embed only the lexical front-runners of very long candidate lists
+        pool = np.arange(len(candidates))
+        if len(candidates) > MAX_EMBEDDED_CANDIDATES:
+            pool = np.argsort(-scores, kind="stable")[:MAX_EMBEDDED_CANDIDATES]
+
+        query_emb = self.llm_client.embed(query)
+        embs = self.llm_client.embed_batch([candidates[i] for i in pool])
+        norms = np.linalg.norm(embs, axis=1) * np.linalg.norm(query_emb)
+        sims = np.dot(embs, query_emb) / np.where(norms == 0, 1, norms)
+
+        # Units outside the embedded pool rank below every embedded one
+        ranked = np.full(len(candidates), -2.0)
+        ranked[pool] = sims
+        return ranked
+
+    def select(self, scored, budget):
+        """
+        Greedily take (score, text) pairs by descending score while they fit.
+        :return: list of (index, text) in selection order.
+        """
+        order = sorted(range(len(scored)), key=lambda i: -scored[i][0])
+        chosen = []
+        used = 0
+        for i in order:
+            cost = count_tokens(scored[i][1])
+            if used + cost > budget:
+                continue
+            chosen.append((i, scored[i][1]))
+            used += cost
+        return chosen
+
+    def pack(self, candidates, budget, query=None, separator="\n", keep_order=True):
+        candidates = [c for c in candidates if c and c.strip()]
+        if sum(count_tokens(c) for c in candidates) <= budget:
+            return separator.join(candidates)
+        scores = self.score(query, candidates)
+        chosen = self.select(list(zip(scores, candidates)), budget)
+        if keep_order:
+            chosen.sort()
+        return separator.join(text for _, text in chosen)
+
+    def pack_text(self, text, budget, query=None, by_lines=False):
+        if not text or count_tokens(text) <= budget:
+            return text or ""
+        if by_lines:
+            # Oversized lines (e.g. raw paragraphs) are broken into sentences
+            units = []
+            for line in text.split("\n"):
+                units.extend(split_sentences(line) if count_tokens(line) > budget // 4 else [line])
+            return self.pack(units, budget, query=query, separator="\n")
+        return self.pack(split_sentences(text), budget, query=query, separator=" ")
@@ -0,0 +1,194 @@
+import os
+import json
+import queue
+import socket
+import struct
+import logging
+import argparse
+import threading
+import socketserver
+from concurrent.futures import Future
+import numpy as np
+
+logger = logging.getLogger("EmbeddingServer")
+
+EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+DEFAULT_SOCKET = "/tmp/podcast_embeddings.sock"
+MAX_FRAME_BYTES = 64 * 1024 * 1024
+ERROR_ROWS = 0xFFFFFFFF
+
+def recv_exact(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Embedding socket closed")
+        data.extend(chunk)
+    return bytes(data)
+
+def send_texts(sock, texts):
+    payload = json.dumps(texts).encode('utf-8')
+    sock.sendall(struct.pack("!I", len(payload)) + payload)
+
+def recv_texts(sock):
+    (size,) = struct.unpack("!I", recv_exact(sock, 4))
+    if size > MAX_FRAME_BYTES:
+        raise ValueError(f"Request of {size} bytes exceeds {MAX_FRAME_BYTES}")
+    return json.loads(recv_exact(sock, size).decode('utf-8'))
+
+def send_embeddings(sock, embeddings):
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    rows, dim = embeddings.shape
+    sock.sendall(struct.pack("!II", rows, dim) + embeddings.tobytes())
+
+def send_error(sock, message):
+    payload = message.encode('utf-8')
+    sock.sendall(struct.pack("!II", ERROR_ROWS, len(payload)) + payload)
+
+def recv_embeddings(sock):
+    rows, dim = struct.unpack("!II", recv_exact(sock, 8))
+    if rows == ERROR_ROWS:
+        raise RuntimeError(f"Embedding server error: {recv_exact(sock, dim).decode('utf-8')}")
+    return np.frombuffer(recv_exact(sock, rows * dim * 4), dtype=np.float32).reshape(rows, dim)
+
+
+class EmbeddingClient:
+    """Connection to an EmbeddingServer; one socket per calling thread."""
+    def __init__(self, socket_path=DEFAULT_SOCKET, timeout=60):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def encode(self, texts):
+        """:return: float32 array with one row per text"""
+        for attempt in range(2):
+            sock = self._socket()
+            try:
+                send_texts(sock, list(texts))
+                return recv_embeddings(sock)
+            except (ConnectionError, BrokenPipeError, socket.timeout):
+                # The server may have restarted since this socket was opened
+                self._local.sock = None
+                sock.close()
+                if attempt == 1:
+                    raise
+
+    def _socket(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            # A blocking connect waits out a full accept backlog instead of failing with EAGAIN
+            sock.connect(self.socket_path)
+            sock.settimeout(self.timeout)
+            self._local.sock = sock
+        return sock
+
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128 # every worker thread of every process may connect at once
+
+
+class _Request:
+    def __init__(self, texts):
+        self.texts = texts
+        self.future = Future()
+
+
+class EmbeddingServer:
+    """
+    Serves one SentenceTransformer to every process on the host over a Unix
+    socket. Requests that arrive while the model is busy are coalesced into a
+    single encode() call of up to `max_batch` texts.
+    """
+    def __init__(self, socket_path=DEFAULT_SOCKET, model_name=EMBEDDING_MODEL, max_batch=256, max_wait=0.005):
+        from sentence_transformers import SentenceTransformer
+        self.socket_path = socket_path
+        self.model_name = model_name
+        self.model = SentenceTransformer(model_name)
+        self.max_batch = max_batch
+        self.max_wait = max_wait # seconds to wait for more requests once one is pending
+        self.requests = queue.Queue()
+        self.batches = 0
+        self.texts = 0
+
+    def encode(self, texts):
+        request = _Request(texts)
+        self.requests.put(request)
+        return request.future.result()
+
+    def _batch_loop(self):
+        while True:
+            batch = [self.requests.get()]
+            size = len(batch[0].texts)
+            while size < self.max_batch:
+                try:
+                    request = self.requests.get(timeout=self.max_wait)
+                except queue.Empty:
+                    break
+                batch.append(request)
+                size += len(request.texts)
+            self._encode_batch(batch)
+
+    def _encode_batch(self, batch):
+        texts = [text for request in batch for text in request.texts]
+        try:
+            embeddings = np.asarray(self.model.encode(texts), dtype=np.float32)
+        except Exception as e:
+            for request in batch:
+                request.future.set_exception(e)
+            return
+        self.batches += 1
+        self.texts += len(texts)
+        start = 0
+        for request in batch:
+            end = start + len(request.texts)
+            request.future.set_result(embeddings[start:end])
+            start = end
+
+    def serve_forever(self):
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        server = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                # Clients keep the connection open across requests
+                while True:
+                    try:
+                        texts = recv_texts(self.request)
+                    except (ConnectionError, OSError):
+                        return
+                    except ValueError as e:
+                        send_error(self.request, str(e))
+                        return
+                    if not texts:
+                        send_embeddings(self.request, np.empty((0, 0), dtype=np.float32))
+                        continue
+                    try:
+                        embeddings = server.encode(texts)
+                    except Exception as e:
+                        send_error(self.request, str(e))
+                        continue
+                    send_embeddings(self.request, embeddings)
+
+        threading.Thread(target=self._batch_loop, daemon=True).start()
+        with _UnixServer(self.socket_path, Handler) as unix_server:
+            os.chmod(self.socket_path, 0o600)
+            logger.info(f"Serving {self.model_name} embeddings on {self.socket_path}")
+            try:
+                unix_server.serve_forever()
+            finally:
+                os.remove(self.socket_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Share one embedding model between all app and worker processes")
+    parser.add_argument("--socket", default=os.getenv("EMBEDDING_SOCKET", DEFAULT_SOCKET))
+    parser.add_argument("--model", default=EMBEDDING_MODEL)
+    parser.add_argument("--max-batch", type=int, default=256)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    print(f"Loading {args.model}... set EMBEDDING_SOCKET={args.socket} for app.py and worker.py")
+    EmbeddingServer(args.socket, args.model, max_batch=args.max_batch).serve_forever()
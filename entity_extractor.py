@@ -1,6 +1,6 @@
-import json
-import re
 from llm_client import SimpleLLMClient
+from text_utils import count_tokens
+from extraction_parser import parse_extraction, parse_sections
 
 EXTRACTION_PROMPT = """
 Extract entities and relationships from this text.
@@ -31,27 +31,117 @@ Return only valid JSON in this format:
 }}
 """
 
+BATCH_EXTRACTION_PROMPT = """
+Extract entities and relationships from each numbered section of text below.
+Treat every section independently.
+
+Entity Types: Person, Organization, Location, Event, Concept
+
+For each entity provide:
+- name: exact name from text
+- type: one of the entity types above
+- description: brief description (1-2 sentences)
+
+For each relationship provide:
+- source: entity name
+- target: entity name
+- description: nature of relationship (1 sentence)
+
+{sections}
+
+Return only valid JSON with exactly one entry per section, using the section ids above:
+{{
+  "sections": [
+    {{
+      "id": 0,
+      "entities": [
+        {{"name": "Apple", "type": "Organization", "description": "Technology company"}}
+      ],
+      "relationships": [
+        {{"source": "Steve Jobs", "target": "Apple", "description": "Founded the company"}}
+      ]
+    }}
+  ]
+}}
+"""
+
+SECTION_TEMPLATE = "[Section {id}]\n{text}\n"
+
 class EntityExtractor:
     def __init__(self, llm_client):
         self.llm_client = llm_client
+        self.stats = {
+            "requests": 0,
+            "batched_chunks": 0,
+            "retried_chunks": 0,
+            "malformed_responses": 0,
+            "salvaged_responses": 0,
+            "invalid_entities": 0,
+            "invalid_relationships": 0
+        }
 
     def extract(self, text):
         prompt = EXTRACTION_PROMPT.format(text=text)
         response = self.llm_client.complete(prompt)
-
-        try:
-            result = json.loads(response)
-            return result
-        except json.JSONDecodeError:
-            json_match = re.search(r'```json\s*(.*?)\s*```', response, re.DOTALL)
-            if json_match:
-                return json.loads(json_match.group(1))
-
-            json_match = re.search(r'\{.*\}', response, re.DOTALL)
-            if json_match:
-                return json.loads(json_match.group())
-
-            return {"entities": [], "relationships": []}
+        self.stats["requests"] += 1
+
+        result, report = parse_extraction(response)
+        self.record(report)
+        return result
+
+    def record(self, report):
+        self.stats["malformed_responses"] += int(report["malformed"])
+        self.stats["salvaged_responses"] += int(report["salvaged"])
+        self.stats["invalid_entities"] += report["invalid_entities"]
+        self.stats["invalid_relationships"] += report["invalid_relationships"]
+
+    def extract_batch(self, chunks, max_tokens=2000):
+        """
+        Extract several chunks per request.
+        :param chunks: list of (chunk_id, text)
+        :param max_tokens: budget for the chunk texts packed into one request
+        :return: dict of chunk_id -> {"entities": [...], "relationships": [...]}
+        """
+        results = {}
+        for batch in self.group_batches(chunks, max_tokens):
+            if len(batch) == 1:
+                chunk_id, text = batch[0]
+                results[chunk_id] = self.extract(text)
+                continue
+
+            sections = "\n".join(SECTION_TEMPLATE.format(id=chunk_id, text=text) for chunk_id, text in batch)
+            response = self.llm_client.complete(BATCH_EXTRACTION_PROMPT.format(sections=sections))
+            self.stats["requests"] += 1
+            self.stats["batched_chunks"] += len(batch)
+
+            parsed, report = parse_sections(response)
+            self.record(report)
+            for chunk_id, text in batch:
+                section = parsed.get(str(chunk_id))
+                if section is None:
+                    # Missing or malformed section: extract this chunk on its own
+                    self.stats["retried_chunks"] += 1
+                    section = self.extract(text)
+                results[chunk_id] = section
+        return results
+
+    def group_batches(self, chunks, max_tokens):
+        batch = []
+        used = 0
+        for chunk_id, text in chunks:
+            cost = self.section_cost(text)
+            if batch and used + cost > max_tokens:
+                yield batch
+                batch = []
+                used = 0
+            batch.append((chunk_id, text))
+            used += cost
+        if batch:
+            yield batch
+
+    def section_cost(self, text):
+        # Chunk text plus its "[Section id]" header
+        return count_tokens(text) + 5
 
 if __name__ == "__main__":
     client = SimpleLLMClient()
@@ -0,0 +1,111 @@
+import re
+import numpy as np
+
+CORPORATE_SUFFIXES = {
+    "inc", "incorporated", "corp", "corporation", "co", "company",
+    "ltd", "limited", "llc", "plc", "gmbh", "ag", "sa"
+}
+LEADING_ARTICLES = {"the", "a", "an"}
+NON_WORD = re.compile(r"[^\w\s]")
+# Two or more dotted single letters: "U.S.", "J. R. R."
+DOTTED_ACRONYM = re.compile(r"(?<!\w)(?:\w\.\s?)+\w(?!\w)\.?\s?")
+
+
+def normalize_name(name):
+    """
+    Map surface forms of a name to one key:
+    "Apple", "Apple Inc." and "apple inc" -> "apple"; "U.S." and "US" -> "us".
+    """
+    key = name.casefold().replace("&", " and ")
+    key = re.sub(r"['’]s\b", "", key)
+    key = DOTTED_ACRONYM.sub(lambda m: m.group().replace(".", "").replace(" ", "") + " ", key)
+    tokens = NON_WORD.sub(" ", key).split()
+    if len(tokens) > 1 and tokens[0] in LEADING_ARTICLES:
+        tokens = tokens[1:]
+    stripped = False
+    # "Marks & Co" -> "marks": an "and" left dangling by a suffix goes too
+    while len(tokens) > 1 and (tokens[-1] in CORPORATE_SUFFIXES or (stripped and tokens[-1] == "and")):
+        tokens = tokens[:-1]
+        stripped = True
+    return " ".join(tokens) or name.strip().casefold()
+
+
+class EntityResolver:
+    def __init__(self):
+        self.aliases = {} # normalized key -> canonical name
+
+    def resolve(self, name):
+        key = normalize_name(name)
+        canonical = self.aliases.get(key)
+        if canonical is None:
+            # The first surface form seen becomes the canonical id
+            canonical = self.aliases[key] = name
+        return canonical
+
+    def merge(self, mapping):
+        """Point every key of the merged-away names (alias -> canonical) at their canonical name."""
+        for key, target in self.aliases.items():
+            if target in mapping:
+                self.aliases[key] = mapping[target]
+
+    def aliases_of(self, canonical):
+        return [key for key, target in self.aliases.items() if target == canonical]
+
+
+class _UnionFind:
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, i):
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            # Keep the lower index (earlier entity) as the root
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+
+def similar_groups(embeddings, threshold=0.92, blocks=None, n_tables=4, n_bits=8, max_bucket=256, seed=42):
+    """
+    Group rows whose cosine similarity is at least `threshold` without comparing
+    every pair: random-hyperplane LSH buckets the vectors and only rows sharing a
+    bucket (and a block, e.g. the entity type) are compared, bucket by bucket, with
+    one matrix product each.
+    :return: list of groups (lists of row indices, lowest first) with more than one member
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    n = len(embeddings)
+    if n < 2:
+        return []
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    unit = embeddings / np.where(norms == 0, 1, norms)
+    blocks = np.zeros(n, dtype=np.int64) if blocks is None else np.asarray(blocks)
+
+    rng = np.random.default_rng(seed)
+    weights = 1 << np.arange(n_bits)
+    uf = _UnionFind(n)
+    for _ in range(n_tables):
+        planes = rng.standard_normal((unit.shape[1], n_bits)).astype(np.float32)
+        codes = ((unit @ planes) > 0).astype(np.int64) @ weights
+        buckets = {}
+        for i, key in enumerate(zip(blocks.tolist(), codes.tolist())):
+            buckets.setdefault(key, []).append(i)
+
+        for members in buckets.values():
+            for start in range(0, len(members), max_bucket):
+                idx = np.array(members[start:start + max_bucket])
+                if len(idx) < 2:
+                    continue
+                sims = unit[idx] @ unit[idx].T
+                rows, cols = np.nonzero(np.triu(sims >= threshold, k=1))
+                for a, b in zip(rows.tolist(), cols.tolist()):
+                    uf.union(int(idx[a]), int(idx[b]))
+
+    groups = {}
+    for i in range(n):
+        groups.setdefault(uf.find(i), []).append(i)
+    return [g for g in groups.values() if len(g) > 1]
@@ -0,0 +1,200 @@
+import json
+
+ENTITY_TYPES = ["Person", "Organization", "Location", "Event", "Concept"]
+DEFAULT_ENTITY_TYPE = "Concept"
+MAX_NAME_LENGTH = 200
+
+
+def scan_objects(text):
+    """
+    Find every balanced {...} span in one pass, skipping braces inside JSON strings.
+    :return: list of (start, end, depth) with end exclusive, in closing order.
+    """
+    spans = []
+    stack = []
+    in_string = False
+    escaped = False
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == '{':
+            stack.append(i)
+        elif ch == '}' and stack:
+            start = stack.pop()
+            spans.append((start, i + 1, len(stack)))
+    return spans
+
+
+def loads_or_none(text):
+    try:
+        return json.loads(text)
+    except (json.JSONDecodeError, ValueError):
+        return None
+
+
+def new_report():
+    return {
+        "malformed": False,
+        "salvaged": False,
+        "invalid_entities": 0,
+        "invalid_relationships": 0
+    }
+
+
+def validate_entity(item):
+    if not isinstance(item, dict):
+        return None
+    name = item.get("name")
+    if not isinstance(name, str) or not name.strip() or len(name) > MAX_NAME_LENGTH:
+        return None
+
+    raw_type = item.get("type")
+    entity_type = DEFAULT_ENTITY_TYPE
+    if isinstance(raw_type, str):
+        for known in ENTITY_TYPES:
+            if raw_type.strip().lower() == known.lower():
+                entity_type = known
+                break
+
+    description = item.get("description")
+    return {
+        "name": name.strip(),
+        "type": entity_type,
+        "description": description.strip() if isinstance(description, str) else ""
+    }
+
+
+def validate_relationship(item):
+    if not isinstance(item, dict):
+        return None
+    source = item.get("source")
+    target = item.get("target")
+    if not isinstance(source, str) or not isinstance(target, str):
+        return None
+    source, target = source.strip(), target.strip()
+    if not source or not target or source == target:
+        return None
+
+    description = item.get("description")
+    return {
+        "source": source,
+        "target": target,
+        "description": description.strip() if isinstance(description, str) else ""
+    }
+
+
+def validate_result(data, report):
+    result = {"entities": [], "relationships": []}
+    entities = data.get("entities") if isinstance(data.get("entities"), list) else []
+    relationships = data.get("relationships") if isinstance(data.get("relationships"), list) else []
+
+    for item in entities:
+        entity = validate_entity(item)
+        if entity:
+            result["entities"].append(entity)
+        else:
+            report["invalid_entities"] += 1
+
+    for item in relationships:
+        rel = validate_relationship(item)
+        if rel:
+            result["relationships"].append(rel)
+        else:
+            report["invalid_relationships"] += 1
+    return result
+
+
+def salvage(text, spans, report):
+    """Keep whichever entity/relationship objects parse on their own."""
+    result = {"entities": [], "relationships": []}
+    for start, end, depth in sorted(spans):
+        item = loads_or_none(text[start:end])
+        if not isinstance(item, dict):
+            continue
+        if "name" in item:
+            entity = validate_entity(item)
+            if entity:
+                result["entities"].append(entity)
+            else:
+                report["invalid_entities"] += 1
+        elif "source" in item or "target" in item:
+            rel = validate_relationship(item)
+            if rel:
+                result["relationships"].append(rel)
+            else:
+                report["invalid_relationships"] += 1
+    return result
+
+
+def largest_top_level(text, spans, accept):
+    # Prefer the largest top-level object that parses (e.g. inside ``` fences or prose)
+    for start, end, depth in sorted((s for s in spans if s[2] == 0), key=lambda s: s[0] - s[1]):
+        data = loads_or_none(text[start:end])
+        if isinstance(data, dict) and accept(data):
+            return data
+    return None
+
+
+def parse_extraction(response):
+    """
+    Parse a single-chunk extraction response, salvaging what it can.
+    :return: (result, report) where result has validated "entities"/"relationships".
+    """
+    report = new_report()
+    text = response or ""
+
+    data = loads_or_none(text.strip())
+    if isinstance(data, dict):
+        return validate_result(data, report), report
+
+    spans = scan_objects(text)
+    data = largest_top_level(text, spans, lambda d: "entities" in d or "relationships" in d)
+    if data is not None:
+        return validate_result(data, report), report
+
+    report["malformed"] = True
+    report["salvaged"] = True
+    return salvage(text, spans, report), report
+
+
+def parse_sections(response):
+    """
+    Parse a batched extraction response into per-section results.
+    Sections that do not parse on their own are left out so the caller can retry them.
+    :return: (dict of section id -> result, report)
+    """
+    report = new_report()
+    text = response or ""
+    sections = {}
+
+    data = loads_or_none(text.strip())
+    spans = []
+    if not (isinstance(data, dict) and isinstance(data.get("sections"), list)):
+        spans = scan_objects(text)
+        data = largest_top_level(text, spans, lambda d: isinstance(d.get("sections"), list))
+
+    if data is not None:
+        entries = data["sections"]
+    else:
+        # Keep every section object that parses by itself
+        report["malformed"] = True
+        entries = []
+        for start, end, depth in sorted(spans):
+            entry = loads_or_none(text[start:end])
+            if isinstance(entry, dict) and "id" in entry:
+                entries.append(entry)
+
+    for entry in entries:
+        if not isinstance(entry, dict) or "id" not in entry:
+            continue
+        if not isinstance(entry.get("entities", []), list) or not isinstance(entry.get("relationships", []), list):
+            continue
+        sections[str(entry["id"])] = validate_result(entry, report)
+    return sections, report
@@ -1,50 +1,393 @@
+import re
+import sys
+from array import array
+from bisect import bisect_left
+from collections import deque
+import numpy as np
 import networkx as nx
 from entity_extractor import EntityExtractor
+from entity_resolver import EntityResolver, similar_groups
 from llm_client import SimpleLLMClient
 
+DESCRIPTION_CONSOLIDATION_PROMPT = """
+Merge these notes about the {type} "{name}" into one concise description (2-3 sentences).
+Keep every distinct fact; drop repetition.
+
+Notes:
+{snippets}
+
+Description:
+"""
+
+SNIPPET_NOISE = re.compile(r"[\W_]+")
+
+# Rough resident size of one node / edge in a networkx.Graph
+NX_NODE_BYTES = 200
+NX_EDGE_BYTES = 360
+
+def snippet_key(text):
+    return SNIPPET_NOISE.sub(" ", text.casefold()).strip()
+
 class Entity:
-    def __init__(self, name, type, description, source_chunks=None):
+    __slots__ = ("id", "name", "type", "snippets", "description_chars", "dropped_snippets", "source_chunks")
+
+    # Bounds on the description kept per entity
+    MAX_SNIPPETS = 8
+    MAX_DESCRIPTION_CHARS = 1200
+
+    def __init__(self, name, type, description, source_chunks=None, id=None):
+        self.id = id
         self.name = name
-        self.type = type
-        self.description = description
-        self.source_chunks = source_chunks if source_chunks else set()
+        self.type = sys.intern(type) if isinstance(type, str) else type
+        self.snippets = {} # normalized key -> snippet, in insertion order
+        self.description_chars = 0
+        self.dropped_snippets = 0
+        self.add_description(description)
+        # Sorted, unique chunk ids packed as unsigned ints
+        self.source_chunks = array("I", sorted(set(source_chunks))) if source_chunks else array("I")
+
+    @property
+    def description(self):
+        return " ".join(self.snippets.values())
+
+    @description.setter
+    def description(self, text):
+        self.snippets = {}
+        self.description_chars = 0
+        self.add_description(text)
+
+    def add_description(self, text):
+        text = (text or "").strip()
+        key = snippet_key(text)
+        if not key or key in self.snippets:
+            return False
+        if not self.snippets and len(text) > self.MAX_DESCRIPTION_CHARS:
+            # An entity keeps at least the start of its first description
+            text = text[:self.MAX_DESCRIPTION_CHARS].rstrip()
+        if len(self.snippets) >= self.MAX_SNIPPETS or self.description_chars + len(text) > self.MAX_DESCRIPTION_CHARS:
+            # Full: remember the pressure so consolidation can make room
+            self.dropped_snippets += 1
+            return False
+        self.snippets[key] = text
+        self.description_chars += len(text)
+        return True
+
+    def add_chunk(self, chunk_id):
+        chunks = self.source_chunks
+        # Chunks usually arrive in increasing order, making this an append
+        if not chunks or chunk_id > chunks[-1]:
+            chunks.append(chunk_id)
+            return
+        pos = bisect_left(chunks, chunk_id)
+        if chunks[pos] != chunk_id:
+            chunks.insert(pos, chunk_id)
+
+    def add_chunks(self, chunk_ids):
+        for chunk_id in chunk_ids:
+            self.add_chunk(chunk_id)
 
 class Relationship:
+    """Read-only view of one edge; KnowledgeGraph stores edges column-wise."""
+    __slots__ = ("source", "target", "description", "weight")
+
     def __init__(self, source, target, description, weight=1):
         self.source = source
         self.target = target
         self.description = description
         self.weight = weight
 
-class KnowledgeGraph:
+class RelationshipList:
+    """Sequence over a graph's edge columns that builds Relationship objects on demand."""
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __len__(self):
+        return len(self.graph.edge_sources)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return self.graph.edge(index)
+
+    def __iter__(self):
+        graph = self.graph
+        names = graph.node_names
+        for i in range(len(graph.edge_sources)):
+            yield Relationship(
+                names[graph.edge_sources[i]],
+                names[graph.edge_targets[i]],
+                graph.edge_descriptions[i],
+                graph.edge_weights[i]
+            )
+
+class EdgeIndex:
+    """
+    Maps (source id, target id) keys to edge positions using sorted NumPy columns
+    plus a small dict of recent inserts that is merged in periodically.
+    """
+    MIN_PENDING = 4096
+
     def __init__(self):
-        self.entities = {}
-        self.relationships = []
+        self.keys = np.empty(0, dtype=np.int64)
+        self.positions = np.empty(0, dtype=np.uint32)
+        self.pending = {}
+
+    def __len__(self):
+        return len(self.keys) + len(self.pending)
+
+    def get(self, key):
+        position = self.pending.get(key)
+        if position is not None or not len(self.keys):
+            return position
+        i = self.keys.searchsorted(key)
+        if i < len(self.keys) and self.keys[i] == key:
+            return int(self.positions[i])
+        return None
+
+    def add(self, key, position):
+        self.pending[key] = position
+        if len(self.pending) >= max(self.MIN_PENDING, len(self.keys) // 4):
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        keys = np.concatenate([self.keys, np.fromiter(self.pending.keys(), dtype=np.int64, count=len(self.pending))])
+        positions = np.concatenate([self.positions, np.fromiter(self.pending.values(), dtype=np.uint32, count=len(self.pending))])
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        self.positions = positions[order]
+        self.pending = {}
+
+    @classmethod
+    def from_keys(cls, keys):
+        index = cls()
+        keys = np.asarray(keys, dtype=np.int64)
+        order = np.argsort(keys, kind="stable")
+        index.keys = keys[order]
+        index.positions = order.astype(np.uint32)
+        return index
+
+    def nbytes(self):
+        return self.keys.nbytes + self.positions.nbytes + sys.getsizeof(self.pending)
+
+class KnowledgeGraph:
+    def __init__(self, resolve_names=True):
+        self.entities = {} # name -> Entity
+        # Every name (entity or relationship endpoint) is interned to an integer node id
+        self.node_ids = {}
+        self.node_names = []
+        # Edges as parallel columns; edge i runs edge_sources[i] -> edge_targets[i]
+        self.edge_sources = array("I")
+        self.edge_targets = array("I")
+        self.edge_weights = array("I")
+        self.edge_descriptions = []
+        self.edge_index = EdgeIndex() # (source id << 32) | target id -> edge position
+        # Maps surface forms ("Apple Inc.", "apple") onto one canonical entity name
+        self.resolver = EntityResolver() if resolve_names else None
+        # Structural version, bumped whenever nodes or edges change
+        self.version = 0
+        # Bumped whenever an entity is added, merged away or re-described
+        self.content_version = 0
+        # Names added, re-described or rewired since the last take_dirty()
+        self.dirty_nodes = set()
+        # Cached projections: the networkx graph is patched in place, the CSR matrix rebuilt
+        self._nx_graph = None
+        self._csr = None
+
+    @property
+    def relationships(self):
+        return RelationshipList(self)
+
+    def canonical(self, name):
+        return self.resolver.resolve(name) if self.resolver else name
+
+    def node_id(self, name):
+        node = self.node_ids.get(name)
+        if node is None:
+            node = self.node_ids[name] = len(self.node_names)
+            self.node_names.append(name)
+        return node
+
+    def edge(self, i):
+        names = self.node_names
+        return Relationship(names[self.edge_sources[i]], names[self.edge_targets[i]],
+                            self.edge_descriptions[i], self.edge_weights[i])
 
     def add_entity(self, name, type, description, chunk_id):
-        if name in self.entities:
-            self.entities[name].source_chunks.add(chunk_id)
-            if description not in self.entities[name].description:
-                self.entities[name].description += " " + description
+        name = self.canonical(name)
+        self.dirty_nodes.add(name)
+        entity = self.entities.get(name)
+        if entity is not None:
+            entity.add_chunk(chunk_id)
+            if entity.add_description(description):
+                self.content_version += 1
+        else:
+            self.entities[name] = Entity(name, type, description, [chunk_id], id=self.node_id(name))
+            self.content_version += 1
+            self._changed()
+            if self._nx_graph is not None:
+                self._nx_graph.add_node(name)
+
+    def add_relationship(self, source, target, description, weight=1):
+        source = self.canonical(source)
+        target = self.canonical(target)
+        if source == target:
+            return
+        self.dirty_nodes.add(source)
+        self.dirty_nodes.add(target)
+
+        key = (self.node_id(source) << 32) | self.node_id(target)
+        existing = self.edge_index.get(key)
+        if existing is not None:
+            self.edge_weights[existing] += weight
+        else:
+            self.edge_index.add(key, len(self.edge_sources))
+            self.edge_sources.append(key >> 32)
+            self.edge_targets.append(key & 0xFFFFFFFF)
+            self.edge_weights.append(weight)
+            self.edge_descriptions.append(description)
+
+        self._changed()
+        if self._nx_graph is not None:
+            self._add_nx_edge(self._nx_graph, source, target, weight)
+
+    def take_dirty(self):
+        """Return and reset the names touched since the previous call."""
+        dirty, self.dirty_nodes = self.dirty_nodes, set()
+        return dirty
+
+    def _changed(self):
+        self.version += 1
+        self._csr = None
+
+    @staticmethod
+    def _add_nx_edge(G, source, target, weight):
+        # Both directions of a pair share one undirected edge; their weights add up
+        if G.has_edge(source, target):
+            G[source][target]["weight"] += weight
         else:
-            self.entities[name] = Entity(name, type, description, {chunk_id})
+            G.add_edge(source, target, weight=weight)
+
+    def merge_entities(self, mapping):
+        """
+        Fold entities into their canonical names and rewire relationships.
+        :param mapping: dict of alias name -> canonical name
+        """
+        remap = np.arange(len(self.node_names), dtype=np.int64)
+        applied = {}
+        for alias, canonical in mapping.items():
+            # Follow chains (A -> B, B -> C) to the final name, stopping on a cycle
+            seen = {alias}
+            while canonical in mapping and canonical not in seen:
+                seen.add(canonical)
+                canonical = mapping[canonical]
+            if canonical in seen or alias not in self.entities or canonical not in self.entities:
+                continue
+            merged = self.entities.pop(alias)
+            target = self.entities[canonical]
+            applied[alias] = canonical
+            target.add_chunks(merged.source_chunks)
+            for snippet in merged.snippets.values():
+                target.add_description(snippet)
+            remap[self.node_ids[alias]] = target.id
+            self.node_ids[alias] = target.id
+            self.dirty_nodes.add(alias)
+            self.dirty_nodes.add(canonical)
+
+        if len(self.edge_sources):
+            sources = remap[np.frombuffer(self.edge_sources, dtype=np.uint32)]
+            targets = remap[np.frombuffer(self.edge_targets, dtype=np.uint32)]
+            weights = np.frombuffer(self.edge_weights, dtype=np.uint32).astype(np.int64)
+            keep = sources != targets
+            keys = (sources[keep] << 32) | targets[keep]
+            kept = np.nonzero(keep)[0]
+
+            # Collapse edges that now coincide: first description wins, weights add up
+            unique_keys, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+            summed = np.bincount(inverse, weights=weights[keep]).astype(np.int64)
+            order = np.argsort(first, kind="stable")
+
+            descriptions = self.edge_descriptions
+            self.edge_sources = array("I", (unique_keys[order] >> 32).astype(np.uint32).tobytes())
+            self.edge_targets = array("I", (unique_keys[order] & 0xFFFFFFFF).astype(np.uint32).tobytes())
+            self.edge_weights = array("I", summed[order].astype(np.uint32).tobytes())
+            self.edge_descriptions = [descriptions[kept[first[i]]] for i in order]
+            self.edge_index = EdgeIndex.from_keys(unique_keys[order])
+
+        if self.resolver:
+            self.resolver.merge(applied)
+        self.content_version += 1
+        self._changed()
+        self._nx_graph = None
+
+    def merge_similar_entities(self, llm_client, threshold=0.92):
+        """
+        Merge entities of the same type whose names embed almost identically.
+        :return: dict of merged alias -> canonical name
+        """
+        names = list(self.entities.keys())
+        if len(names) < 2:
+            return {}
+        embeddings = llm_client.embed_batch(names)
+        types = [self.entities[n].type for n in names]
+        type_ids = {t: i for i, t in enumerate(sorted(set(types)))}
 
-    def add_relationship(self, source, target, description):
-        for rel in self.relationships:
-            if rel.source == source and rel.target == target:
-                rel.weight += 1
-                return
+        mapping = {}
+        for group in similar_groups(embeddings, threshold, blocks=[type_ids[t] for t in types]):
+            canonical = names[group[0]]
+            for i in group[1:]:
+                mapping[names[i]] = canonical
+        if mapping:
+            self.merge_entities(mapping)
+        return mapping
 
-        self.relationships.append(Relationship(source, target, description))
+    def consolidate_descriptions(self, llm_client, threshold=4):
+        """
+        Deferred pass: rewrite descriptions made of `threshold` or more snippets
+        (or that overflowed) into one consolidated snippet.
+        :return: number of entities consolidated
+        """
+        consolidated = 0
+        for name, entity in self.entities.items():
+            if len(entity.snippets) < threshold and not entity.dropped_snippets:
+                continue
+            if len(entity.snippets) < 2:
+                continue
+            prompt = DESCRIPTION_CONSOLIDATION_PROMPT.format(
+                type=entity.type,
+                name=name,
+                snippets="\n".join(f"- {s}" for s in entity.snippets.values())
+            )
+            summary = llm_client.complete(prompt).strip()
+            if summary:
+                entity.description = summary[:Entity.MAX_DESCRIPTION_CHARS]
+                entity.dropped_snippets = 0
+                self.dirty_nodes.add(name)
+                self.content_version += 1
+                consolidated += 1
+        return consolidated
+
+    def edge_positions(self, names):
+        """Positions of edges touching any of `names`."""
+        ids = [self.node_ids[n] for n in names if n in self.node_ids]
+        if not ids or not len(self.edge_sources):
+            return []
+        sources = np.frombuffer(self.edge_sources, dtype=np.uint32)
+        targets = np.frombuffer(self.edge_targets, dtype=np.uint32)
+        ids = np.array(ids, dtype=np.uint32)
+        return np.nonzero(np.isin(sources, ids) | np.isin(targets, ids))[0].tolist()
+
+    def relationships_of(self, names):
+        return [self.edge(i) for i in self.edge_positions(names)]
 
     def get_neighbors(self, entity_name):
-        neighbors = set()
-        for rel in self.relationships:
-            if rel.source == entity_name:
-                neighbors.add(rel.target)
-            elif rel.target == entity_name:
-                neighbors.add(rel.source)
-        return neighbors
+        node = self.node_ids.get(entity_name)
+        if node is None:
+            return set()
+        adjacency = self.to_csr()
+        row = adjacency.indices[adjacency.indptr[node]:adjacency.indptr[node + 1]]
+        return {self.node_names[other] for other in row.tolist()}
 
     def get_subgraph(self, entity_names, depth=1):
         all_entities = set(entity_names)
@@ -62,32 +405,138 @@ class KnowledgeGraph:
                     all_entities.add(neighbor)
                     queue.append((neighbor, dist + 1))
 
-        subgraph = KnowledgeGraph()
+        return self.induced_subgraph(all_entities)
+
+    def induced_subgraph(self, entity_names):
+        """Copy of the given entities and the relationships among them."""
+        all_entities = set(entity_names)
+        subgraph = KnowledgeGraph(resolve_names=False)
         for name in all_entities:
             if name in self.entities:
                 e = self.entities[name]
-                for chunk_id in e.source_chunks:
-                    subgraph.add_entity(e.name, e.type, e.description, chunk_id)
+                copy = Entity(e.name, e.type, "", e.source_chunks, id=subgraph.node_id(name))
+                for snippet in e.snippets.values():
+                    copy.add_description(snippet)
+                subgraph.entities[name] = copy
 
-        for rel in self.relationships:
+        for i in self.edge_positions(all_entities):
+            rel = self.edge(i)
             if rel.source in all_entities and rel.target in all_entities:
-                subgraph.add_relationship(rel.source, rel.target, rel.description)
+                subgraph.add_relationship(rel.source, rel.target, rel.description, rel.weight)
 
         return subgraph
 
+    def personalized_pagerank(self, seeds, alpha=0.15, epsilon=1e-4, max_pushes=20000):
+        """
+        Approximate PageRank personalized to `seeds` ({name: weight}), computed by
+        local pushes over the weighted adjacency (Andersen, Chung & Lang). A node is
+        only expanded while its residual is at least `epsilon` times its weighted
+        degree, so the work depends on epsilon rather than on the size of the graph.
+        :return: {name: score}; scores sum to at most 1
+        """
+        adjacency = self.to_csr()
+        indptr, indices, weights = adjacency.indptr, adjacency.indices, adjacency.data
+        degrees = {}
+
+        def degree(node):
+            if node not in degrees:
+                degrees[node] = float(weights[indptr[node]:indptr[node + 1]].sum())
+            return degrees[node]
+
+        total = sum(w for name, w in seeds.items() if name in self.node_ids and w > 0)
+        if total <= 0:
+            return {}
+        residual = {self.node_ids[name]: w / total for name, w in seeds.items() if name in self.node_ids and w > 0}
+        estimate = {}
+        queue = deque(residual)
+        queued = set(residual)
+
+        pushes = 0
+        while queue and pushes < max_pushes:
+            node = queue.popleft()
+            queued.discard(node)
+            mass = residual.pop(node, 0.0)
+            node_degree = degree(node)
+            if node_degree == 0:
+                # Nowhere to spread: the node keeps all of its mass
+                estimate[node] = estimate.get(node, 0.0) + mass
+                continue
+            estimate[node] = estimate.get(node, 0.0) + alpha * mass
+            pushes += 1
+            start, end = indptr[node], indptr[node + 1]
+            spread = (1 - alpha) * mass / node_degree
+            for other, weight in zip(indices[start:end].tolist(), weights[start:end].tolist()):
+                residual[other] = residual.get(other, 0.0) + spread * weight
+                if other not in queued and residual[other] >= epsilon * degree(other):
+                    queue.append(other)
+                    queued.add(other)
+
+        return {self.node_names[node]: score for node, score in estimate.items()}
+
     def to_networkx(self):
+        """
+        Undirected, weighted projection of the graph. It is cached and kept in
+        sync with later edits, so callers must not modify it.
+        """
+        if self._nx_graph is None:
+            self._nx_graph = self._build_networkx()
+        return self._nx_graph
+
+    def _build_networkx(self):
         G = nx.Graph()
-        for name in self.entities:
-            G.add_node(name)
-        for rel in self.relationships:
-            G.add_edge(rel.source, rel.target, weight=rel.weight)
+        linked = set()
+        if len(self.edge_sources):
+            linked = set(np.union1d(np.array(self.edge_sources), np.array(self.edge_targets)).tolist())
+        # Node order follows node ids, the order a patched projection would have seen them in
+        G.add_nodes_from(name for node, name in enumerate(self.node_names)
+                         if node in linked or name in self.entities)
+        names = self.node_names
+        for source, target, weight in zip(self.edge_sources, self.edge_targets, self.edge_weights):
+            self._add_nx_edge(G, names[source], names[target], weight)
         return G
 
+    def to_csr(self):
+        """
+        Symmetric weighted adjacency as a scipy.sparse CSR matrix; row and column i
+        are node_names[i]. Cached until the graph next changes.
+        """
+        if self._csr is None:
+            from scipy.sparse import csr_matrix
+
+            # np.array copies out of the growing edge columns instead of pinning their buffers
+            sources = np.array(self.edge_sources, dtype=np.int64)
+            targets = np.array(self.edge_targets, dtype=np.int64)
+            weights = np.array(self.edge_weights, dtype=np.float64)
+            n = len(self.node_names)
+            # Duplicate (row, col) pairs, i.e. edges in both directions, are summed
+            self._csr = csr_matrix(
+                (np.concatenate([weights, weights]), (np.concatenate([sources, targets]), np.concatenate([targets, sources]))),
+                shape=(n, n)
+            )
+        return self._csr
+
+    def estimate_bytes(self):
+        """Approximate memory held by the graph's entities and edge columns."""
+        total = sum(a.buffer_info()[1] * a.itemsize for a in (self.edge_sources, self.edge_targets, self.edge_weights))
+        total += sys.getsizeof(self.edge_descriptions) + self.edge_index.nbytes()
+        total += sum(sys.getsizeof(d) for d in self.edge_descriptions)
+        total += sys.getsizeof(self.node_names) + sys.getsizeof(self.node_ids)
+        total += sum(sys.getsizeof(n) for n in self.node_names)
+        for entity in self.entities.values():
+            total += sys.getsizeof(entity) + sys.getsizeof(entity.snippets) + sys.getsizeof(entity.source_chunks)
+            total += entity.description_chars
+        if self._csr is not None:
+            total += self._csr.data.nbytes + self._csr.indices.nbytes + self._csr.indptr.nbytes
+        if self._nx_graph is not None:
+            total += NX_NODE_BYTES * self._nx_graph.number_of_nodes() + NX_EDGE_BYTES * self._nx_graph.number_of_edges()
+        return total
+
     def stats(self):
+        num_relationships = len(self.edge_sources)
         return {
             "num_entities": len(self.entities),
-            "num_relationships": len(self.relationships),
-            "avg_degree": 2 * len(self.relationships) / len(self.entities) if self.entities else 0
+            "num_relationships": num_relationships,
+            "avg_degree": 2 * num_relationships / len(self.entities) if self.entities else 0
         }
 
 if __name__ == "__main__":
@@ -1,78 +1,194 @@
+import math
 import matplotlib.pyplot as plt
 import networkx as nx
 from llm_client import SimpleLLMClient
-from text_utils import chunk_text
+from text_utils import iter_chunks
 from entity_extractor import EntityExtractor
 from graph_models import KnowledgeGraph
-from community_detector import CommunityDetector
+from community_detector import CommunityDetector, CommunityHierarchy
 from community_summarizer import CommunitySummarizer
-from query_engine import QueryEngine
+from query_engine import QueryEngine, LOCAL_MAX_NODES
+from chunk_dedup import ChunkDeduplicator
+from index_cache import BuildCancelled
 plt.ion()
 
+class InsertCancelled(BuildCancelled):
+    pass
+
 class SimpleGraphRAG:
-    def __init__(self, llm_client):
+    def __init__(self, llm_client, merge_threshold=None, consolidate_threshold=None, dedup_threshold=0.85):
         self.llm_client = llm_client
+        # Cosine similarity above which same-type entity names are merged; None disables
+        self.merge_threshold = merge_threshold
+        # Snippet count above which entity descriptions are rewritten by the LLM; None disables
+        self.consolidate_threshold = consolidate_threshold
         self.extractor = EntityExtractor(llm_client)
         self.graph = KnowledgeGraph()
         self.detector = CommunityDetector()
         self.summarizer = CommunitySummarizer(llm_client)
+        self.hierarchy = CommunityHierarchy([])
+        # Per level, the community ids the last insert() created or changed
+        self.changed_communities = []
+        # Top level of the hierarchy
         self.communities = {}
         self.community_summaries = {}
+        self.chunks = []
+        # Estimated Jaccard similarity at which a chunk reuses an earlier chunk's extraction; None disables
+        self.dedup = ChunkDeduplicator(dedup_threshold) if dedup_threshold is not None else None
+        # chunk_id -> extraction result kept for near-duplicates to reuse, for the chunks
+        # still in the dedup index (every chunk of an insert in progress)
+        self.extractions = {}
+        # Within one insert(): chunk_id -> id of the chunk whose extraction it reuses
+        self.duplicate_of = {}
+        self.dedup_stats = {"duplicate_chunks": 0, "tokens_saved": 0, "requests_saved": 0}
         self.query_engine = None
 
-    def insert(self, documents, chunk_size=1000):
-        print("📄 Chunking documents...")
-        all_chunks = []
+    def insert(self, documents, chunk_tokens=250, overlap_sentences=1, batch_tokens=2000, cancel=None):
+        """
+        :param documents: strings or file-like objects; files are chunked as they are read.
+        :param batch_tokens: chunk text packed into each extraction request; 0 sends one chunk per request.
+        :param cancel: threading.Event; once set, InsertCancelled is raised before the next LLM
+            request, leaving the index partially built
+        """
+        def check_cancelled():
+            if cancel is not None and cancel.is_set():
+                raise InsertCancelled()
+
+        print("📄 Chunking and extracting entities and relationships...")
+        processed = 0
+        pending = []
+        pending_tokens = 0
+        reused = []
+        reused_tokens = 0
         for doc in documents:
-            chunks = chunk_text(doc, chunk_size)
-            all_chunks.extend(chunks)
-        print(f"   Created {len(all_chunks)} chunks")
-
-        print("\n🔍 Extracting entities and relationships...")
-        for i, chunk in enumerate(all_chunks):
-            result = self.extractor.extract(chunk)
-
-            for entity in result['entities']:
-                self.graph.add_entity( entity['name'], entity['type'], entity['description'], i)
-
-            for rel in result['relationships']:
-                self.graph.add_relationship( rel['source'], rel['target'], rel['description'])
-
-            if (i + 1) % 10 == 0:
-                print(f"   Processed {i + 1}/{len(all_chunks)} chunks")
+            for chunk in iter_chunks(doc, chunk_tokens, overlap_sentences, start_id=len(self.chunks)):
+                check_cancelled()
+                self.chunks.append(chunk.text)
+                if self.dedup is not None:
+                    signature = self.dedup.signature(chunk.text)
+                    match = self.dedup.find(signature)
+                    if match is not None:
+                        # Keeps its own chunk id, so the reused entities still cite it as a source
+                        self.duplicate_of[chunk.id] = match[0]
+                        reused.append(chunk.id)
+                        reused_tokens += self.extractor.section_cost(chunk.text)
+                        continue
+                    self.dedup.add(chunk.id, signature)
+
+                if not batch_tokens:
+                    self.add_extraction(chunk.id, self.extractor.extract(chunk.text))
+                    processed += 1
+                    if processed % 10 == 0:
+                        print(f"   Processed {processed} chunks")
+                    continue
+
+                cost = self.extractor.section_cost(chunk.text)
+                if pending and pending_tokens + cost > batch_tokens:
+                    processed += self.extract_pending(pending, batch_tokens)
+                    print(f"   Processed {processed} chunks")
+                    pending = []
+                    pending_tokens = 0
+                pending.append((chunk.id, chunk.text))
+                pending_tokens += cost
+
+        if pending:
+            check_cancelled()
+            processed += self.extract_pending(pending, batch_tokens)
+        check_cancelled()
+        print(f"   Processed {processed} chunks in total "
+              f"({self.extractor.stats['requests']} extraction requests)")
+
+        if reused:
+            # Originals may have sat in a later batch, so reuse only once everything is extracted
+            for chunk_id in reused:
+                self.add_extraction(chunk_id, self.extractions[self.duplicate_of[chunk_id]])
+            saved = math.ceil(reused_tokens / batch_tokens) if batch_tokens else len(reused)
+            self.dedup_stats["duplicate_chunks"] += len(reused)
+            self.dedup_stats["tokens_saved"] += reused_tokens
+            self.dedup_stats["requests_saved"] += saved
+            print(f"   Reused extractions for {len(reused)} near-duplicate chunks "
+                  f"(~{saved} extraction requests, {reused_tokens} tokens saved)")
+        if self.dedup is not None:
+            # Later inserts can only match chunks still in the (bounded) dedup index
+            signatures = self.dedup.signatures
+            self.extractions = {chunk_id: result for chunk_id, result in self.extractions.items() if chunk_id in signatures}
+            self.duplicate_of = {}
+
+        if self.merge_threshold is not None:
+            merged = self.graph.merge_similar_entities(self.llm_client, self.merge_threshold)
+            print(f"   Merged {len(merged)} near-duplicate entities")
+
+        if self.consolidate_threshold is not None:
+            consolidated = self.graph.consolidate_descriptions(self.llm_client, self.consolidate_threshold)
+            print(f"   Consolidated {consolidated} entity descriptions")
 
         stats = self.graph.stats()
         print(f"   Graph: {stats['num_entities']} entities, "
               f"{stats['num_relationships']} relationships")
 
         print("\n🌐 Detecting communities...")
-        self.communities = self.detector.detect_communities(self.graph)
-        print(f"   Found {len(self.communities)} communities")
-
+        dirty = self.graph.take_dirty()
+        if self.hierarchy.levels:
+            # Later inserts only re-partition the communities they touched
+            self.hierarchy, self.changed_communities = self.detector.update_hierarchy(self.graph, self.hierarchy, dirty)
+        else:
+            self.hierarchy = self.detector.detect_hierarchy(self.graph)
+            self.changed_communities = [set(level) for level in self.hierarchy.levels]
+        self.communities = self.hierarchy.communities()
+        print(f"   Found {len(self.communities)} communities "
+              f"(per level, finest first: {self.hierarchy.stats()['communities_per_level']}), "
+              f"{sum(len(c) for c in self.changed_communities)} new or changed")
+
+        check_cancelled()
         print("\n📝 Summarizing communities...")
-        for comm_id, entities in self.communities.items():
-            subgraph = self.graph.get_subgraph(entities)
-            self.community_summaries[comm_id] = self.summarizer.summarize_community(subgraph)
+        calls = self.summarizer.summarize_hierarchy(self.graph, self.hierarchy, self.changed_communities)
+        self.community_summaries = self.hierarchy.summaries_at()
+        print(f"   Wrote {calls} summaries")
 
         print("\n🚀 Initializing query engine...")
+        previous_engine = self.query_engine
         self.query_engine = QueryEngine(
             self.llm_client,
             self.graph,
             self.communities,
-            self.community_summaries
+            self.community_summaries,
+            self.hierarchy
         )
+        if previous_engine:
+            # Keep embeddings of summaries that survived the update
+            current = {summary for level in self.hierarchy.summaries for summary in level.values()}
+            self.query_engine.summary_embeddings = {
+                text: emb for text, emb in previous_engine.summary_embeddings.items() if text in current
+            }
 
         print("\n✅ GraphRAG ready!")
 
-    def query_local(self, question, top_k=5):
+    def extract_pending(self, pending, batch_tokens):
+        results = self.extractor.extract_batch(pending, batch_tokens)
+        for chunk_id, _ in pending:
+            self.add_extraction(chunk_id, results[chunk_id])
+        return len(pending)
+
+    def add_extraction(self, chunk_id, result):
+        if self.dedup is not None and chunk_id not in self.duplicate_of:
+            self.extractions[chunk_id] = result
+        for entity in result['entities']:
+            self.graph.add_entity( entity['name'], entity['type'], entity['description'], chunk_id)
+
+        for rel in result['relationships']:
+            self.graph.add_relationship( rel['source'], rel['target'], rel['description'])
+
+    def query_local(self, question, top_k=5, max_nodes=LOCAL_MAX_NODES):
         if not self.query_engine:
             raise ValueError("Must call insert() first")
-        return self.query_engine.local_search(question, top_k)
+        return self.query_engine.local_search(question, top_k, max_nodes)
 
-    def query_global(self, question, top_k=3):
+    def query_global(self, question, top_k=3, level=None, traverse=False, map_reduce=False):
         if not self.query_engine:
             raise ValueError("Must call insert() first")
-        return self.query_engine.global_search(question, top_k)
+        if map_reduce:
+            return self.query_engine.map_reduce_search(question, level)
+        return self.query_engine.global_search(question, top_k, level, traverse)
 
     def visualize_graph(self):
         G = self.graph.to_networkx()
@@ -107,7 +223,7 @@ if __name__ == "__main__":
         """
     ]
 
-    graphrag.insert(documents, chunk_size=500)
+    graphrag.insert(documents, chunk_tokens=120)
     graphrag.visualize_graph()
 
     print("\n" + "="*70)
@@ -0,0 +1,167 @@
+import os
+import sys
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger("IndexCache")
+
+# Rough per-community overhead (list + dict slot) on top of member references
+OBJECT_OVERHEAD = 200
+
+
+class BuildCancelled(Exception):
+    """Raised by a build whose caller gave up on it; callers waiting on it build for themselves."""
+
+
+def content_hash(content):
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def estimate_index_bytes(graphrag):
+    """Approximate resident size of a built SimpleGraphRAG index."""
+    total = sum(sys.getsizeof(c) for c in graphrag.chunks)
+    total += graphrag.graph.estimate_bytes()
+    hierarchy = graphrag.hierarchy
+    # Levels share the summary of a community carried over unchanged; count it once
+    seen = set()
+    for level in hierarchy.summaries:
+        for summary in level.values():
+            if id(summary) not in seen:
+                seen.add(id(summary))
+                total += sys.getsizeof(summary)
+    for level in hierarchy.levels:
+        for members in level.values():
+            total += 8 * len(members) + OBJECT_OVERHEAD
+    if graphrag.dedup is not None:
+        # Signatures and extractions kept for later inserts to reuse (bounded by the dedup index)
+        total += sum(sig.nbytes + OBJECT_OVERHEAD for sig in graphrag.dedup.signatures.values())
+        for result in graphrag.extractions.values():
+            for item in result['entities'] + result['relationships']:
+                total += OBJECT_OVERHEAD + sum(sys.getsizeof(value) for value in item.values())
+    # Entity embeddings are filled in lazily by the first queries
+    engine = graphrag.query_engine
+    if engine is not None and engine.entity_index.vectors is not None:
+        total += engine.entity_index.vectors.nbytes
+    return total
+
+
+class _Build:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class GraphIndexCache:
+    """
+    LRU cache of built GraphRAG indexes (or any index, given its `size_fn`) keyed
+    by source content hash. Concurrent requests for the same source share a single build.
+    """
+    def __init__(self, max_entries=8, max_bytes=512 * 1024 * 1024, size_fn=estimate_index_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size_fn = size_fn
+        self._lock = threading.Lock()
+        self._entries = OrderedDict() # key -> (index, size)
+        self._builds = {} # key -> _Build in flight
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.evictions = 0
+
+    def get_or_build(self, content, build):
+        """
+        Return the cached index for `content`, calling `build(content)` at most once
+        across all threads while it is missing.
+        """
+        key = content_hash(content)
+        while True:
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return self._entries[key][0]
+
+                flight = self._builds.get(key)
+                owner = flight is None
+                if owner:
+                    flight = self._builds[key] = _Build()
+                    self.misses += 1
+                else:
+                    self.waits += 1
+
+            if owner:
+                break
+            flight.done.wait()
+            if isinstance(flight.error, BuildCancelled):
+                # Cancelled by its owner (e.g. an abandoned prewarm), not failed: take over
+                continue
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            index = build(content)
+            size = self.size_fn(index)
+            with self._lock:
+                if size <= self.max_bytes:
+                    self._entries[key] = (index, size)
+                    self.total_bytes += size
+                    self._evict()
+                else:
+                    logger.warning(f"Index for {key[:12]} ({size} bytes) exceeds cache limit, not cached")
+            flight.result = index
+            return index
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            # Always release the key, or every later caller would wait on this build forever
+            with self._lock:
+                del self._builds[key]
+            flight.done.set()
+
+    def get(self, content):
+        with self._lock:
+            entry = self._entries.get(content_hash(content))
+            return entry[0] if entry else None
+
+    def invalidate(self, content):
+        with self._lock:
+            entry = self._entries.pop(content_hash(content), None)
+            if entry:
+                self.total_bytes -= entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes):
+            key, (_, size) = self._entries.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+            logger.info(f"Evicted index {key[:12]} ({size} bytes)")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "total_bytes": self.total_bytes,
+                "in_flight": len(self._builds),
+                "hits": self.hits,
+                "misses": self.misses,
+                "waits": self.waits,
+                "evictions": self.evictions
+            }
+
+
+# Shared by every agent and job in this process
+index_cache = GraphIndexCache(
+    max_entries=int(os.getenv("GRAPH_INDEX_CACHE_ENTRIES", "8")),
+    max_bytes=int(os.getenv("GRAPH_INDEX_CACHE_MB", "512")) * 1024 * 1024
+)
@@ -0,0 +1,187 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+ACTIVE = ('queued', 'running')
+
+def process_alive(pid):
+    if os.name == 'nt':
+        # os.kill(pid, 0) would signal the process on Windows; rely on heartbeats
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class JobStore:
+    """
+    Job records shared by every web and worker process on the host, in SQLite.
+    WAL mode lets status reads proceed while a job is being saved. A job is
+    queued, claimed by exactly one worker, kept alive by that worker's
+    heartbeat and ends completed or failed. A running job whose worker stopped
+    heartbeating (or whose process is gone) can be claimed again.
+    """
+    def __init__(self, path="jobs.db", stale_after=60):
+        self.path = path
+        self.stale_after = stale_after
+        self.hostname = socket.gethostname()
+        self._local = threading.local()
+        with self._transaction() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    fingerprint TEXT,
+                    status TEXT NOT NULL,
+                    worker TEXT,
+                    heartbeat REAL,
+                    saved INTEGER NOT NULL DEFAULT 0,
+                    data TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    updated REAL NOT NULL
+                )""")
+            # Job sources by content hash, written once instead of with every checkpoint
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sources (
+                    source_hash TEXT PRIMARY KEY,
+                    content TEXT NOT NULL
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_fingerprint ON jobs (fingerprint, status)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)")
+
+    def _connection(self):
+        # sqlite3 connections must stay on the thread that opened them
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        # IMMEDIATE takes the write lock up front, so read-then-update is atomic across processes
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def create(self, job_id, job, worker=None, coalesce=False, ignore_existing=False):
+        """
+        Insert a job; `worker` claims it right away instead of queueing it.
+        :param coalesce: return the id of a queued or running job with the same fingerprint instead
+        :param ignore_existing: keep the stored job if `job_id` already exists
+        :return: the id of the job to follow
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            if coalesce and job.get('fingerprint'):
+                row = conn.execute(
+                    "SELECT job_id FROM jobs WHERE fingerprint = ? AND status IN (?, ?) ORDER BY created LIMIT 1",
+                    (job['fingerprint'], *ACTIVE)).fetchone()
+                if row:
+                    return row[0]
+            conn.execute(
+                f"INSERT {'OR IGNORE ' if ignore_existing else ''}INTO jobs (job_id, fingerprint, status, worker, heartbeat, data, created, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, job.get('fingerprint'), job['status'], worker, now if worker else None,
+                 json.dumps(job, default=str), now, now))
+        return job_id
+
+    def save(self, job_id, job):
+        self._connection().execute(
+            "UPDATE jobs SET status = ?, data = ?, updated = ? WHERE job_id = ?",
+            (job['status'], json.dumps(job, default=str), time.time(), job_id))
+
+    def save_source(self, source_hash, content):
+        self._connection().execute(
+            "INSERT OR IGNORE INTO sources (source_hash, content) VALUES (?, ?)", (source_hash, content))
+
+    def get_source(self, source_hash):
+        row = self._connection().execute("SELECT content FROM sources WHERE source_hash = ?", (source_hash,)).fetchone()
+        return row[0] if row else None
+
+    def get(self, job_id):
+        row = self._connection().execute("SELECT status, data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = json.loads(row[1])
+        job['status'] = row[0]
+        return job
+
+    def latest_completed(self, fingerprint):
+        """:return: (job_id, job) of the newest completed job with this fingerprint, or None"""
+        row = self._connection().execute(
+            "SELECT job_id, data FROM jobs WHERE fingerprint = ? AND status = 'completed' ORDER BY updated DESC LIMIT 1",
+            (fingerprint,)).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def claim(self, job_id, worker, statuses=('queued',)):
+        """Take a job that is in one of `statuses` or orphaned; True if `worker` now owns it."""
+        with self._transaction() as conn:
+            row = conn.execute("SELECT status, worker, heartbeat FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None or not (row[0] in statuses or self.orphaned(*row, claimant=worker)):
+                return False
+            self._assign(conn, job_id, 'running', worker)
+            return True
+
+    def claim_next(self, worker):
+        """:return: the id of the oldest queued or orphaned job, now owned by `worker`, or None"""
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT job_id, status, worker, heartbeat FROM jobs WHERE status IN (?, ?) ORDER BY created",
+                ACTIVE).fetchall()
+            for job_id, status, owner, heartbeat in rows:
+                if status == 'queued' or self.orphaned(status, owner, heartbeat, claimant=worker):
+                    self._assign(conn, job_id, 'running', worker)
+                    return job_id
+        return None
+
+    def requeue(self, job_id):
+        """Put a failed or orphaned job back in the queue; True if it was."""
+        with self._transaction() as conn:
+            row = conn.execute("SELECT status, worker, heartbeat FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None or not (row[0] in ('queued', 'failed') or self.orphaned(*row)):
+                return False
+            self._assign(conn, job_id, 'queued', None)
+            return True
+
+    def _assign(self, conn, job_id, status, worker):
+        now = time.time()
+        conn.execute(
+            "UPDATE jobs SET status = ?, worker = ?, heartbeat = ?, updated = ? WHERE job_id = ?",
+            (status, worker, now if worker else None, now, job_id))
+
+    def orphaned(self, status, worker, heartbeat, claimant=None):
+        if status != 'running':
+            return False
+        if heartbeat is None or heartbeat < time.time() - self.stale_after:
+            return True
+        # Worker ids are "host:pid:nonce"; on this host a dead pid needs no timeout
+        host, pid = (worker or '::').split(':')[:2]
+        if host != self.hostname or not pid.isdigit():
+            return False
+        if int(pid) == os.getpid():
+            # A restarted process can get its predecessor's pid (e.g. pid 1 in a container)
+            return claimant is not None and worker != claimant
+        return not process_alive(int(pid))
+
+    def heartbeat(self, worker):
+        self._connection().execute(
+            "UPDATE jobs SET heartbeat = ? WHERE worker = ? AND status = 'running'", (time.time(), worker))
+
+    def mark_saved(self, job_id):
+        """True for exactly one caller per job, across processes."""
+        cursor = self._connection().execute("UPDATE jobs SET saved = 1 WHERE job_id = ? AND saved = 0", (job_id,))
+        return cursor.rowcount == 1
@@ -1,41 +1,100 @@
 import os
+import time
+import logging
+import threading
 import numpy as np
 from groq import Groq
-from sentence_transformers import SentenceTransformer
 from dotenv import load_dotenv
 from langsmith import traceable
+from embedding_server import EmbeddingClient, EMBEDDING_MODEL
 
 load_dotenv()
 
+logger = logging.getLogger("LLMClient")
+
+# Seconds to use the in-process model before trying the embedding server again
+EMBEDDING_RETRY_INTERVAL = 30
+
+# One model per process, however many clients the orchestrator and graphs create
+_embedding_model = None
+_embedding_lock = threading.Lock()
+
+def shared_embedding_model():
+    global _embedding_model
+    with _embedding_lock:
+        if _embedding_model is None:
+            from sentence_transformers import SentenceTransformer
+            _embedding_model = SentenceTransformer(EMBEDDING_MODEL)
+        return _embedding_model
+
 class SimpleLLMClient:
     def __init__(self):
         api_key = os.getenv("GROQ_API_KEY", "").strip()
         print(f"DEBUG: LLMClient loaded key: {api_key[:5]}...{api_key[-4:] if len(api_key)>10 else ''} (Len: {len(api_key)})")
         self.client = Groq(api_key=api_key)
         self.model = "llama-3.3-70b-versatile"
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+        # Optional embedding_server.py shared by all processes on the host
+        socket_path = os.getenv("EMBEDDING_SOCKET")
+        self.embedding_client = EmbeddingClient(socket_path) if socket_path else None
+        self._embedding_retry_at = 0 # while in the future, the server is considered down
+        self._local_model = None
 
-    # @traceable(run_type="llm")
-    def complete(self, prompt, system_prompt=None):
+    @property
+    def embedding_model(self):
+        # Loaded on first use, so processes served by the embedding server never load it
+        if self._local_model is None:
+            self._local_model = shared_embedding_model()
+        return self._local_model
+
+    def _encode(self, texts):
+        if self.embedding_client is not None and time.time() >= self._embedding_retry_at:
+            try:
+                embeddings = self.embedding_client.encode(texts)
+                if self._embedding_retry_at:
+                    logger.info("Embedding server is back")
+                    self._embedding_retry_at = 0
+                return embeddings
+            except (OSError, RuntimeError) as e:
+                # E.g. the server is restarting: fall back for now, try it again later
+                logger.warning(f"Embedding server unavailable ({e}), using an in-process model "
+                               f"for {EMBEDDING_RETRY_INTERVAL}s")
+                self._embedding_retry_at = time.time() + EMBEDDING_RETRY_INTERVAL
+        return np.asarray(self.embedding_model.encode(texts))
+
+    def _messages(self, prompt, system_prompt=None):
         messages = []
         if system_prompt:
             messages.append({"role": "system", "content": system_prompt})
         messages.append({"role": "user", "content": prompt})
+        return messages
 
+    # @traceable(run_type="llm")
+    def complete(self, prompt, system_prompt=None):
         response = self.client.chat.completions.create(
             model=self.model,
-            messages=messages,
+            messages=self._messages(prompt, system_prompt),
             temperature=0.0
         )
         return response.choices[0].message.content
 
+    def complete_stream(self, prompt, system_prompt=None):
+        """Yield the completion as text deltas while it is being generated."""
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=self._messages(prompt, system_prompt),
+            temperature=0.0,
+            stream=True
+        )
+        for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                yield delta
+
     def embed(self, text):
-        embedding = self.embedding_model.encode(text)
-        return np.array(embedding)
+        return self._encode([text])[0]
 
     def embed_batch(self, texts):
-        embeddings = self.embedding_model.encode(texts)
-        return np.array(embeddings)
+        return self._encode(list(texts))
 
 if __name__ == "__main__":
     print("✅ Setup complete!")
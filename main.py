@@ -1,6 +1,6 @@
 import numpy as np
 from llm_client import SimpleLLMClient
-from text_utils import chunk_text
+from text_utils import chunk_text, iter_chunks
 from entity_extractor import EntityExtractor
 from graph_models import KnowledgeGraph
 from community_detector import CommunityDetector
@@ -26,6 +26,10 @@ def test_text_chunking():
     print(f"First chunk: {chunks[0][:100]}...")
     print(f"Last chunk: {chunks[-1][:100]}...")
 
+    sentence_chunks = list(iter_chunks(test_text, max_tokens=60))
+    print(f"Created {len(sentence_chunks)} sentence-aligned chunks")
+    print(f"First chunk {sentence_chunks[0]}: {sentence_chunks[0].text[:100]}...")
+
 def test_llm_client():
     print("\n" + "="*60)
     print("TESTING LLM CLIENT")
@@ -262,7 +266,7 @@ def test_complete_graphrag():
         """
     ]
 
-    graphrag.insert(documents, chunk_size=500)
+    graphrag.insert(documents, chunk_tokens=120)
 
     print("\n" + "="*70)
     print("QUERYING THE COMPLETE GRAPHRAG SYSTEM")
@@ -280,6 +284,49 @@ def test_complete_graphrag():
         print(f"🌍 Global Search: {graphrag.query_global(q)}")
         print("-" * 50)
 
+def test_prewarm_cancel():
+    print("\n" + "="*60)
+    print("TESTING CANCELLED PREWARM WITH A WAITING JOB")
+    print("="*60)
+
+    import threading
+    import time
+    from index_cache import GraphIndexCache
+    from graph_rag import InsertCancelled
+    from source_prewarm import SourcePrewarmer
+
+    cache = GraphIndexCache(size_fn=lambda index: 1)
+    started = threading.Event()
+    builds = []
+
+    def build(content, cancel=None):
+        builds.append(cancel)
+        started.set()
+        for _ in range(50):
+            if cancel is not None and cancel.is_set():
+                raise InsertCancelled()
+            time.sleep(0.01)
+        return f"index of {content}"
+
+    source = "An uploaded source document."
+    prewarmer = SourcePrewarmer(lambda content, cancel: cache.get_or_build(content, lambda c: build(c, cancel)))
+    print("Prewarm:", prewarmer.submit("upload-1", source))
+    started.wait(5)
+
+    # A job on the same source waits on the prewarm build...
+    result = {}
+    job = threading.Thread(target=lambda: result.update(index=cache.get_or_build(source, build)))
+    job.start()
+    while cache.stats()["waits"] == 0:
+        time.sleep(0.01)
+
+    # ...which is then cancelled, e.g. because the upload was replaced
+    print("Cancelled:", prewarmer.cancel("upload-1"))
+    job.join(5)
+    print("Job got:", result.get("index"), "after", len(builds), "builds")
+    assert result.get("index") == f"index of {source}"
+    assert len(builds) == 2 and cache.get(source) == result["index"]
+
 if __name__ == "__main__":
     print("✅ Setup complete!")
     print("🚀 Running comprehensive GraphRAG tests...\n")
@@ -292,5 +339,6 @@ if __name__ == "__main__":
     test_community_summarization()
     test_query_engine()
     test_complete_graphrag()
+    test_prewarm_cancel()
 
     print("\n🎉 All tests completed successfully!")
\ No newline at end of file
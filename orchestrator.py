@@ -1,6 +1,7 @@
 import threading
 import time
 import uuid
+import socket
 import json
 import os
 import logging
@@ -12,6 +13,11 @@ from agents.fact_checker_agent import FactCheckerAgent
 from agents.tts_agent import TTSAgent
 from agents.audio_mixer_agent import AudioMixerAgent
 from llm_client import SimpleLLMClient
+from agent_scheduler import AgentScheduler
+from script_stream import ScriptStream
+from job_store import JobStore
+from index_cache import content_hash
+from prompts import PROMPT_VERSIONS
 
 # Configure Logging
 logging.basicConfig(
@@ -24,68 +30,332 @@ logging.basicConfig(
 )
 logger = logging.getLogger("Orchestrator")
 
+def job_fingerprint(context):
+    # Same source, topic, voice and prompts produce the same podcast
+    key = {
+        'source': content_hash(context.get('source_content') or ''),
+        'topic': ' '.join((context.get('topic') or '').split()),
+        'voice': context.get('voice'),
+        'prompts': PROMPT_VERSIONS
+    }
+    return content_hash(json.dumps(key, sort_keys=True))
+
+def public_context(context):
+    # Keys starting with "_" hold live objects (e.g. the script stream)
+    return {key: value for key, value in context.items() if not key.startswith('_')}
+
 class Orchestrator:
-    def __init__(self, output_folder):
+    def __init__(self, output_folder, store=None, run_jobs=True, heartbeat_interval=10):
+        """
+        :param store: shared JobStore; every web and worker process on the host uses the same one
+        :param run_jobs: run new jobs in this process; False only queues them for worker.py
+        """
         self.llm_client = SimpleLLMClient()
         self.output_folder = output_folder
-        self.jobs = {} # job_id -> {status, progress, result, error}
+        self.store = store or JobStore()
+        self.run_jobs = run_jobs
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.heartbeat_interval = heartbeat_interval
+        self.jobs = {} # job_id -> live record of the jobs running in this process
+        self.threads = {} # job_id -> worker thread
+        # job_id -> lock around changes to a running job, which the TTS thread checkpoints too
+        self.job_locks = {}
+        self.lock = threading.Lock()
+        self._heartbeat_thread = None
         self.logs_dir = "logs"
         os.makedirs(self.logs_dir, exist_ok=True)
         
         # Initialize Agents
+        self.retrieval_agent = RetrievalAgent(self.llm_client)
+        self.script_writer = ScriptWriterAgent(self.llm_client)
+        self.fact_checker = FactCheckerAgent(self.llm_client)
+        self.tts_agent = TTSAgent(self.llm_client, output_folder)
         self.agents = [
             PlanningAgent(self.llm_client),
-            RetrievalAgent(self.llm_client),
-            ScriptWriterAgent(self.llm_client),
-            FactCheckerAgent(self.llm_client),
-            TTSAgent(self.llm_client, output_folder),
+            self.retrieval_agent,
+            self.script_writer,
+            self.fact_checker,
+            self.tts_agent,
             AudioMixerAgent(self.llm_client)
         ]
+        # Fact checking and TTS both only need the script, so they run side by side
+        self.scheduler = AgentScheduler(self.agents, step_delay=1)
+
+    def start_job(self, context, force=False):
+        """
+        :param force: regenerate even if an identical job is running or has completed
+        :return: the job_id to poll; a duplicate request gets the running job's id
+        """
+        fingerprint = job_fingerprint(context)
+        if not force:
+            stored = self.load_result(fingerprint)
+            if stored is not None:
+                return self._reuse_result(context, fingerprint, *stored)
 
-    def start_job(self, context):
         job_id = str(uuid.uuid4())
-        self.jobs[job_id] = {
-            'status': 'running',
-            'current_step': 'Initializing',
+        job = {
+            'status': 'running' if self.run_jobs else 'queued',
+            'current_step': 'Initializing' if self.run_jobs else 'Queued',
+            'running_steps': [],
             'steps_completed': [],
+            'audio_segments': [], # playable while the script is still being written
+            'fingerprint': fingerprint,
+            'source_hash': self.save_source(context),
             'context': context,
             'result': None,
             'error': None
         }
+        owner = self.worker_id if self.run_jobs else None
+        # Claimed right away when running here, so no worker.py picks it up too
+        existing = self.store.create(job_id, self.record(job), worker=owner, coalesce=not force)
+        if existing != job_id:
+            logger.info(f"[{existing}] Attached duplicate request")
+            return existing
+        if self.run_jobs:
+            with self.lock:
+                self._start(job_id, job)
         
+        return job_id
+
+    def prewarm_source(self, source_content, cancel=None):
+        """
+        Build and cache what a job on this source will need, before it is requested:
+        the fact checker's passage index (which also loads the embedding model) and,
+        for sources too long to pass through, the GraphRAG index.
+        """
+        if cancel is not None and cancel.is_set():
+            return
+        self.fact_checker.get_source_index(source_content, cancel)
+        if self.retrieval_agent.needs_index(source_content) and not (cancel is not None and cancel.is_set()):
+            self.retrieval_agent.get_index(source_content, cancel)
+
+    def _reuse_result(self, context, fingerprint, stored_id, stored):
+        job_id = str(uuid.uuid4())
+        job = {
+            'status': 'completed',
+            'current_step': 'Reused',
+            'running_steps': [],
+            'steps_completed': [agent.name for agent in self.agents],
+            'audio_segments': [],
+            'fingerprint': fingerprint,
+            'reused_from': stored.get('reused_from') or stored_id,
+            'context': context,
+            'result': stored['result'],
+            'error': None
+        }
+        self.store.create(job_id, self.record(job))
+        logger.info(f"[{job_id}] Reused result of job {job['reused_from']}")
+        return job_id
+
+    def load_result(self, fingerprint):
+        """:return: (job_id, job) of a completed job with this fingerprint whose audio still exists"""
+        stored = self.store.latest_completed(fingerprint)
+        if stored is None:
+            return None
+        # Generated audio may have been cleaned up since
+        audio_url = (stored[1]['result'] or {}).get('audio_url')
+        if not audio_url or not os.path.exists(os.path.join(self.output_folder, os.path.basename(audio_url))):
+            return None
+        return stored
+
+    def _start(self, job_id, job):
+        # Caller holds self.lock and has claimed the job in the store
+        context = job['context']
+        if 'source_content' not in context and job.get('source_hash'):
+            context['source_content'] = self.store.get_source(job['source_hash'])
+            if context['source_content'] is None:
+                logger.warning(f"[{job_id}] Source {job['source_hash'][:12]} is missing from the store")
+        job.update({'status': 'running', 'error': None, 'running_steps': []})
+        job.setdefault('audio_segments', [])
+        job.setdefault('fingerprint', job_fingerprint(job['context']))
+        self.job_locks[job_id] = threading.RLock()
+        self.jobs[job_id] = job
+        self.save_checkpoint(job_id)
         # Run in background thread
         thread = threading.Thread(target=self._run_workflow, args=(job_id,))
+        self.threads[job_id] = thread
         thread.start()
-        
-        return job_id
+        if self._heartbeat_thread is None:
+            self._heartbeat_thread = threading.Thread(target=self._heartbeat, daemon=True)
+            self._heartbeat_thread.start()
+
+    def _heartbeat(self):
+        # Lets other processes tell our running jobs from ones whose worker died
+        while True:
+            time.sleep(self.heartbeat_interval)
+            if self.jobs:
+                try:
+                    self.store.heartbeat(self.worker_id)
+                except Exception as e:
+                    logger.warning(f"Heartbeat failed: {e}")
+
+    def run_next(self):
+        """Claim the oldest queued or orphaned job and run it here. :return: its job_id, or None"""
+        with self.lock:
+            job_id = self.store.claim_next(self.worker_id)
+            if job_id is None:
+                return None
+            job = self.store.get(job_id)
+            logger.info(f"[{job_id}] Claimed after {job['steps_completed'] or 'no steps'}")
+            self._start(job_id, job)
+            return job_id
+
+    def active_jobs(self):
+        return len(self.jobs)
+
+    def resume_job(self, job_id):
+        """
+        Restart a failed or interrupted job from its first incomplete step.
+        :return: the job, or None when there is nothing to resume
+        """
+        with self.lock:
+            if job_id in self.jobs:
+                return self.jobs[job_id]
+            job = self.store.get(job_id) or self.import_file_record(job_id)
+            if job is None or job['status'] == 'completed':
+                return None
+            if not self.run_jobs:
+                # A worker process picks it up
+                return self.store.get(job_id) if self.store.requeue(job_id) else self._active(job_id)
+            if not self.store.claim(job_id, self.worker_id, statuses=('queued', 'failed')):
+                return self._active(job_id)
+            logger.info(f"[{job_id}] Resuming after {job['steps_completed'] or 'no steps'}")
+            self._start(job_id, job)
+            return job
+
+    def import_file_record(self, job_id, checkpoints_dir="checkpoints"):
+        """
+        Add a job recorded only in a file from before jobs.db (its checkpoint, or the run
+        log of a job that failed before checkpointing existed) to the store as failed.
+        :return: the stored job, or None
+        """
+        try:
+            uuid.UUID(job_id)
+        except ValueError:
+            return None
+        for path in (os.path.join(checkpoints_dir, f"{job_id}.json"),
+                     os.path.join(self.logs_dir, f"run_{job_id}_failed.json")):
+            if not os.path.exists(path):
+                continue
+            with open(path) as f:
+                job = json.load(f)
+            job['context'] = public_context(job.get('context') or {})
+            job.update({'status': 'failed', 'running_steps': []})
+            job.pop('updated', None)
+            job.setdefault('steps_completed', [])
+            job.setdefault('audio_segments', [])
+            job.setdefault('fingerprint', job_fingerprint(job['context']))
+            job['source_hash'] = self.save_source(job['context'])
+            # Another process may import it at the same time; either record will do
+            self.store.create(job_id, self.record(job), ignore_existing=True)
+            logger.info(f"[{job_id}] Imported from {path}")
+            return self.store.get(job_id)
+        return None
+
+    def _active(self, job_id):
+        # Already queued or running in a live process
+        job = self.store.get(job_id)
+        return job if job and job['status'] in ('queued', 'running') else None
+
+    def resume_interrupted(self, max_jobs=2, poll_interval=5.0):
+        """
+        Run jobs that are queued or were left running by a process that died (e.g. across
+        a deploy), at most `max_jobs` at a time. :return: the job_ids started right away
+        """
+        resumed = []
+        while len(resumed) < max_jobs:
+            job_id = self.run_next()
+            if job_id is None:
+                return resumed
+            resumed.append(job_id)
+        # More may be waiting: claim them as running jobs finish, like worker.py
+        threading.Thread(target=self._drain_queue, args=(max_jobs, poll_interval), daemon=True).start()
+        return resumed
+
+    def _drain_queue(self, max_jobs, poll_interval):
+        while True:
+            if self.active_jobs() < max_jobs:
+                if self.run_next() is None:
+                    return
+            else:
+                time.sleep(poll_interval)
+
+    def save_source(self, context):
+        """Store the job's source once, for checkpoints to refer to. :return: its content hash"""
+        source = context.get('source_content') or ''
+        source_hash = content_hash(source)
+        self.store.save_source(source_hash, source)
+        return source_hash
+
+    def record(self, job):
+        record = {key: value for key, value in job.items() if key != 'context'}
+        context = public_context(job['context'])
+        if 'source_hash' in job:
+            # Saved once by save_source; a checkpoint carries the step outputs only
+            context.pop('source_content', None)
+        record['context'] = context
+        return record
+
+    def save_checkpoint(self, job_id):
+        # The store row is both the shared status and the checkpoint resumed from.
+        # Saved under the job lock, so checkpoints are consistent and land in order.
+        with self.job_locks[job_id]:
+            self.store.save(job_id, self.record(self.jobs[job_id]))
+
+    def mark_saved(self, job_id):
+        """True the first time it is called for a job, in any process."""
+        return self.store.mark_saved(job_id)
 
     def _run_workflow(self, job_id):
         job = self.jobs[job_id]
         context = job['context']
+        job_lock = self.job_locks[job_id]
         
+        def on_start(agent):
+            with job_lock:
+                job['current_step'] = agent.name
+                job['running_steps'].append(agent.name)
+            self.save_checkpoint(job_id)
+            print(f"[{job_id}] Starting {agent.name}")
+            stream = context.get('_script_stream')
+            if agent is self.script_writer and stream is not None:
+                # Not before: the consumer would only wait through planning and retrieval
+                self.tts_agent.start_streaming(stream, on_segment=on_segment)
+
+        def on_finish(agent):
+            with job_lock:
+                job['running_steps'].remove(agent.name)
+                job['steps_completed'].append(agent.name)
+                self.save_checkpoint(job_id)
+
+        def on_segment(url):
+            # Runs on the TTS thread while the scheduler is still updating the context
+            with job_lock:
+                if self.jobs.get(job_id) is not job or job['status'] != 'running':
+                    # The job ended (and may have been resumed since); the segment is discarded
+                    return
+                job['audio_segments'].append(url)
+                self.save_checkpoint(job_id)
+
+        completed = set(job['steps_completed'])
+        if self.script_writer.name not in completed:
+            # Transient: script lines flow to TTS while ScriptWriterAgent is still writing
+            context['_script_stream'] = ScriptStream()
+
         try:
-            for agent in self.agents:
-                step_name = agent.name
-                job['current_step'] = step_name
-                
-                # Execute Agent
-                print(f"[{job_id}] Starting {step_name}")
-                context = agent.execute(context)
-                
-                # Update Progress
-                job['steps_completed'].append(step_name)
-                job['context'] = context # Update context with new data
-                
-                # Simulate a small delay for visualization
-                time.sleep(1) 
-            
-            job['status'] = 'completed'
-            job['result'] = {
-                'script': context.get('script'),
-                'audio_url': context.get('final_audio_url'),
-                'plan': context.get('plan'),
-                'verification': context.get('verification_notes')
-            }
+            context = self.scheduler.run(context, on_start, on_finish, completed, lock=job_lock)
+            with job_lock:
+                self._end_stream(context)
+                job['status'] = 'completed'
+                job['audio_segments'] = [] # deleted now that they are stitched together
+                job['result'] = {
+                    'script': context.get('script'),
+                    'audio_url': context.get('final_audio_url'),
+                    'plan': context.get('plan'),
+                    'verification': context.get('verification_notes'),
+                    'claims': context.get('claim_verdicts')
+                }
+                self.save_checkpoint(job_id)
             logger.info(f"[{job_id}] Workflow completed successfully.")
             
             # Save Run History
@@ -95,13 +365,33 @@ class Orchestrator:
             
         except Exception as e:
             logger.error(f"[{job_id}] Workflow failed: {e}")
-            job['status'] = 'failed'
-            job['error'] = str(e)
+            with job_lock:
+                self._end_stream(context)
+                job['status'] = 'failed'
+                job['audio_segments'] = []
+                job['error'] = str(e)
+                job['running_steps'] = []
+                self.save_checkpoint(job_id)
             
             # Save Failed Run History
             run_log_path = os.path.join(self.logs_dir, f"run_{job_id}_failed.json")
             with open(run_log_path, 'w') as f:
                 json.dump(job, f, indent=2, default=str)
+        finally:
+            # Status is served from the store from now on. The job lock keeps a late
+            # segment from checkpointing halfway through.
+            with self.lock, job_lock:
+                self.jobs.pop(job_id, None)
+                self.threads.pop(job_id, None)
+                self.job_locks.pop(job_id, None)
+
+    def _end_stream(self, context):
+        # Unblocks the segment consumer if the script was never written, keeps the
+        # stream out of the saved run history and deletes its segment files
+        stream = context.pop('_script_stream', None)
+        if stream is not None:
+            stream.close()
+            self.tts_agent.discard_segments(stream)
 
     def get_job_status(self, job_id):
-        return self.jobs.get(job_id)
+        return self.jobs.get(job_id) or self.store.get(job_id)
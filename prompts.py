@@ -35,3 +35,25 @@ Script:
 Source:
 {source_content}...
 """
+
+PROMPT_FACT_CHECKER_V2 = """
+Check each numbered claim from a podcast script against the source passages listed under it.
+
+{claims}
+
+For every claim give one verdict:
+- "supported": the passages state or directly imply it
+- "contradicted": the passages say something different
+- "unsupported": the passages do not cover it
+
+Respond with JSON only:
+{{"verdicts": [{{"claim": 1, "verdict": "supported", "note": "short reason"}}]}}
+"""
+
+# Bump an entry whenever its prompt changes: job fingerprints include these,
+# so results generated with an older prompt are not reused
+PROMPT_VERSIONS = {
+    'planning': 'v1',
+    'script_writer': 'v1',
+    'fact_checker': 'v2'
+}
@@ -1,5 +1,12 @@
+import hashlib
+import threading
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
 from llm_client import SimpleLLMClient
+from context_packer import ContextPacker, PROMPT_BUDGETS
+from extraction_parser import loads_or_none, scan_objects, largest_top_level
+from text_utils import count_tokens
+from ann_index import VectorIndex
 from graph_models import KnowledgeGraph
 from entity_extractor import EntityExtractor
 from community_detector import CommunityDetector
@@ -33,21 +40,77 @@ Provide a comprehensive answer synthesizing the summaries.
 Answer:
 """
 
+MAP_QUERY_PROMPT = """
+Use these community summaries to answer the question as far as they allow.
+
+{summaries}
+
+Question: {question}
+
+Rate how helpful your answer is for the question from 0 (the summaries are
+irrelevant) to 100 (they answer it fully).
+
+Return only valid JSON:
+{{"answer": "your answer, or an empty string", "score": 0}}
+"""
+
+REDUCE_QUERY_PROMPT = """
+These partial answers were written from different parts of a knowledge graph,
+most helpful first.
+
+{answers}
+
+Question: {question}
+
+Provide a comprehensive answer synthesizing the partial answers. Leave out
+anything they do not support.
+
+Answer:
+"""
+
+NO_ANSWER = "I could not find information relevant to this question in the knowledge graph."
+
+# Entity descriptions embedded per embed_batch call when syncing the index
+EMBED_BATCH_SIZE = 512
+# Local search expansion: subgraph size cap, push precision, and how many PageRank
+# candidates per slot are re-ranked by query similarity
+LOCAL_MAX_NODES = 40
+PPR_EPSILON = 1e-4
+PPR_CANDIDATES_PER_NODE = 3
+
+def description_tag(description):
+    return hashlib.blake2b(description.encode("utf-8"), digest_size=8).hexdigest()
+
 class QueryEngine:
-    def __init__(self, llm_client, graph, communities, community_summaries):
+    def __init__(self, llm_client, graph, communities, community_summaries, hierarchy=None, entity_index=None):
         self.llm_client = llm_client
         self.graph = graph
         self.communities = communities
         self.community_summaries = community_summaries
-
-    def local_search(self, question, top_k=5):
+        # Optional CommunityHierarchy whose top level is `communities`
+        self.hierarchy = hierarchy
+        self.packer = ContextPacker(llm_client)
+        self.budgets = dict(PROMPT_BUDGETS)
+        self.summary_embeddings = {} # summary text -> embedding
+        # Entity description embeddings, kept in sync with the graph; exact search
+        # for small graphs, IVF for large ones. May be a VectorIndex.load()ed one.
+        self.entity_index = entity_index if entity_index is not None else VectorIndex()
+        self.indexed_version = None
+        # Jobs sharing a cached index query it from several threads
+        self.lock = threading.RLock()
+
+    def local_search(self, question, top_k=5, max_nodes=LOCAL_MAX_NODES):
+        """
+        :param max_nodes: entities in the expanded subgraph, seeds included; the
+            prompt is further packed into the local token budgets
+        """
         question_emb = self.llm_client.embed(question)
-        relevant_entities = self.find_relevant_entities(question_emb, top_k)
+        seeds = self.rank_entities(question_emb, top_k)
 
-        subgraph = self.graph.get_subgraph(relevant_entities, depth=2)
+        subgraph = self.graph.induced_subgraph(self.expand_entities(question_emb, seeds, max_nodes))
 
-        entity_text = self.format_entities(subgraph.entities)
-        rel_text = self.format_relationships(subgraph.relationships)
+        entity_text = self.format_entities(subgraph.entities, self.budgets['local_entities'], question)
+        rel_text = self.format_relationships(subgraph.relationships, self.budgets['local_relationships'], question)
 
         prompt = LOCAL_QUERY_PROMPT.format(
             entities=entity_text,
@@ -57,10 +120,19 @@ class QueryEngine:
 
         return self.llm_client.complete(prompt)
 
-    def global_search(self, question, top_k=3):
+    def global_search(self, question, top_k=3, level=None, traverse=False):
+        """
+        :param level: hierarchy level to answer from (0 = finest); None uses the top level.
+        :param traverse: walk down from the top level, ranking only the children of the
+            `top_k` best communities at each step, instead of ranking the whole level.
+        """
         question_emb = self.llm_client.embed(question)
-        relevant_comms = self.find_relevant_communities(question_emb, top_k)
-        summaries_text = self.format_summaries(relevant_comms)
+        if traverse and self.hierarchy is not None and self.hierarchy.levels:
+            level = level or 0
+            relevant_comms = self.traverse_communities(question_emb, top_k, level)
+        else:
+            relevant_comms = self.find_relevant_communities(question_emb, top_k, level)
+        summaries_text = self.format_summaries(relevant_comms, self.budgets['global_summaries'], level)
 
         prompt = GLOBAL_QUERY_PROMPT.format(
             summaries=summaries_text,
@@ -69,50 +141,228 @@ class QueryEngine:
 
         return self.llm_client.complete(prompt)
 
-    def find_relevant_entities(self, query_emb, top_k):
-        names = list(self.graph.entities.keys())
-        descriptions = [self.graph.entities[n].description for n in names]
-
-        embs = self.llm_client.embed_batch(descriptions)
-
-        sims = np.dot(embs, query_emb) / (
-            np.linalg.norm(embs, axis=1) * np.linalg.norm(query_emb)
+    def map_reduce_search(self, question, level=None, max_communities=None, min_score=20, max_workers=8, timeout=None):
+        """
+        Global search over a whole hierarchy level: concurrent map calls answer from
+        batches of summaries and rate their answers, answers rated below `min_score`
+        are dropped and the rest are reduced into one answer under a token budget.
+        :param max_communities: map only the most similar communities; None maps all
+        :param timeout: seconds to wait for map calls; answers still pending are dropped
+        """
+        summaries = self.summaries_at(level)
+        if max_communities is not None:
+            comm_ids = self.find_relevant_communities(self.llm_client.embed(question), max_communities, level)
+        else:
+            comm_ids = list(summaries)
+
+        scored = []
+        for score, answer in self.iter_map_answers(question, comm_ids, level, max_workers, timeout):
+            if score >= min_score:
+                scored.append((score, f"Partial answer (helpfulness {score:.0f}):\n{answer}"))
+        if not scored:
+            return NO_ANSWER
+
+        chosen = self.packer.select(scored, self.budgets['global_reduce'])
+        prompt = REDUCE_QUERY_PROMPT.format(
+            answers="\n\n".join(text for _, text in chosen),
+            question=question
         )
+        return self.llm_client.complete(prompt)
 
-        top_indices = np.argsort(sims)[-top_k:][::-1]
-        return [names[i] for i in top_indices]
-
-    def find_relevant_communities(self, query_emb, top_k):
-        comm_ids = list(self.community_summaries.keys())
-        summaries = [self.community_summaries[i] for i in comm_ids]
+    def iter_map_answers(self, question, comm_ids, level=None, max_workers=8, timeout=None):
+        """Yield (score, answer) per batch of summaries as soon as its map call returns."""
+        batches = self.batch_summaries(comm_ids, level)
+        if not batches:
+            return
+        executor = ThreadPoolExecutor(max_workers=min(max_workers, len(batches)))
+        futures = [executor.submit(self.map_summaries, question, batch) for batch in batches]
+        try:
+            for future in as_completed(futures, timeout=timeout):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"   Map call failed: {e}")
+                    continue
+                if result is not None:
+                    yield result
+        except FuturesTimeoutError:
+            print(f"   {sum(not f.done() for f in futures)} map calls timed out")
+        finally:
+            # Also runs when the caller stops consuming early
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def batch_summaries(self, comm_ids, level=None):
+        """Group summaries, in order, into blocks that fit the map budget."""
+        summaries = self.summaries_at(level)
+        budget = self.budgets['global_map']
+        batches = []
+        current = []
+        used = 0
+        for comm_id in comm_ids:
+            block = f"Community {comm_id}:\n{summaries[comm_id]}"
+            cost = count_tokens(block)
+            if current and used + cost > budget:
+                batches.append("\n\n".join(current))
+                current = []
+                used = 0
+            current.append(block)
+            used += cost
+        if current:
+            batches.append("\n\n".join(current))
+        return batches
+
+    def map_summaries(self, question, summaries_text):
+        response = self.llm_client.complete(MAP_QUERY_PROMPT.format(
+            summaries=summaries_text,
+            question=question
+        ))
+        text = response or ""
+        data = loads_or_none(text.strip())
+        if not isinstance(data, dict):
+            data = largest_top_level(text, scan_objects(text), lambda d: "answer" in d)
+        if not data:
+            return None
+
+        answer = data.get("answer")
+        try:
+            score = float(data.get("score", 0))
+        except (TypeError, ValueError):
+            score = 0.0
+        if not isinstance(answer, str) or not answer.strip():
+            return None
+        return min(max(score, 0.0), 100.0), answer.strip()
 
-        embs = self.llm_client.embed_batch(summaries)
+    def find_relevant_entities(self, query_emb, top_k):
+        return [name for name, _ in self.rank_entities(query_emb, top_k)]
+
+    def expand_entities(self, query_emb, seeds, max_nodes=LOCAL_MAX_NODES):
+        """
+        Grow the seed entities into at most `max_nodes` entities, ranked by
+        personalized PageRank from the seeds (following relationship weights)
+        scaled by each entity's similarity to the query. Hubs next to a seed
+        do not drag their whole neighbourhood in, however dense the graph is.
+        :param seeds: (name, similarity) pairs, best first
+        """
+        seed_names = [name for name, _ in seeds][:max_nodes]
+        # Similarity can be negative; every seed still gets some restart mass
+        scores = self.graph.personalized_pagerank({name: max(sim, 0.01) for name, sim in seeds}, epsilon=PPR_EPSILON)
+        candidates = [name for name in sorted(scores, key=scores.get, reverse=True)
+                      if name not in seed_names and name in self.graph.entities][:PPR_CANDIDATES_PER_NODE * max_nodes]
+        if not candidates:
+            return seed_names
+        with self.lock:
+            sims = self.entity_index.similarities(candidates, query_emb)
+        ranked = sorted(zip(candidates, sims.tolist()), key=lambda c: scores[c[0]] * (1 + c[1]), reverse=True)
+        return seed_names + [name for name, _ in ranked[:max_nodes - len(seed_names)]]
+
+    def find_relevant_communities(self, query_emb, top_k, level=None):
+        return [comm_id for comm_id, _ in self.rank_communities(query_emb, top_k, level)]
+
+    def traverse_communities(self, query_emb, top_k, level=0):
+        """Top-down beam search through the hierarchy, stopping at `level`."""
+        current = self.hierarchy.top
+        beam = self.find_relevant_communities(query_emb, top_k, current)
+        while current > level:
+            children = [c for parent in beam for c in self.hierarchy.children[current].get(parent, [])]
+            current -= 1
+            beam = [c for c, _ in self.rank_communities(query_emb, top_k, current, candidates=children)]
+        return beam
+
+    def summaries_at(self, level=None):
+        if level is None or self.hierarchy is None:
+            return self.community_summaries
+        return self.hierarchy.summaries_at(level)
+
+    def embed_summaries(self, summaries):
+        # Summaries only change when communities are rebuilt, so embed each once
+        missing = [s for s in dict.fromkeys(summaries) if s not in self.summary_embeddings]
+        if missing:
+            embs = self.llm_client.embed_batch(missing)
+            with self.lock:
+                for text, emb in zip(missing, embs):
+                    self.summary_embeddings[text] = emb
+        return np.array([self.summary_embeddings[s] for s in summaries])
+
+    def rank_entities(self, query_emb, top_k):
+        # search() may retrain the IVF lists, so it runs under the lock too
+        with self.lock:
+            self.sync_entity_index()
+            return self.entity_index.search(query_emb, top_k)
+
+    def sync_entity_index(self):
+        """Embed new or re-described entities and drop merged-away ones."""
+        with self.lock:
+            self._sync_entity_index()
+
+    def _sync_entity_index(self):
+        version = self.graph.content_version
+        if self.indexed_version == version:
+            return
+        # Snapshot: an insert may still be adding entities; the next sync picks them up
+        entities = dict(self.graph.entities)
+        index = self.entity_index
+        index.remove([name for name in list(index.slot_of) if name not in entities])
+
+        stale = []
+        for name, entity in entities.items():
+            description = entity.description
+            tag = description_tag(description)
+            if index.tag(name) != tag:
+                stale.append((name, description, tag))
+        for start in range(0, len(stale), EMBED_BATCH_SIZE):
+            batch = stale[start:start + EMBED_BATCH_SIZE]
+            embs = self.llm_client.embed_batch([description for _, description, _ in batch])
+            index.add([name for name, _, _ in batch], embs, [tag for _, _, tag in batch])
+        self.indexed_version = version
+
+    def rank_communities(self, query_emb, top_k, level=None, candidates=None):
+        level_summaries = self.summaries_at(level)
+        if candidates is None:
+            comm_ids = list(level_summaries.keys())
+        else:
+            comm_ids = [c for c in candidates if c in level_summaries]
+        if not comm_ids:
+            return []
+        summaries = [level_summaries[i] for i in comm_ids]
+
+        embs = self.embed_summaries(summaries)
 
         sims = np.dot(embs, query_emb) / (
             np.linalg.norm(embs, axis=1) * np.linalg.norm(query_emb)
         )
 
         top_indices = np.argsort(sims)[-top_k:][::-1]
-        return [comm_ids[i] for i in top_indices]
+        return [(comm_ids[i], float(sims[i])) for i in top_indices]
 
-    def format_entities(self, entities):
-        return "\n".join([
+    def format_entities(self, entities, max_tokens=None, query=None):
+        lines = [
             f"- {name} ({e.type}): {e.description}"
             for name, e in entities.items()
-        ])
+        ]
+        if max_tokens is None:
+            return "\n".join(lines)
+        return self.packer.pack(lines, max_tokens, query=query)
 
-    def format_relationships(self, relationships):
-        return "\n".join([
+    def format_relationships(self, relationships, max_tokens=None, query=None):
+        lines = [
             f"- {r.source} → {r.target}: {r.description}"
             for r in relationships
-        ])
+        ]
+        if max_tokens is None:
+            return "\n".join(lines)
+        return self.packer.pack(lines, max_tokens, query=query)
     
-    def format_summaries(self, relevant_comms):
-        summaries_text = "\n\n".join([
-            f"Community {i}:\n{self.community_summaries[i]}"
+    def format_summaries(self, relevant_comms, max_tokens=None, level=None):
+        summaries = self.summaries_at(level)
+        blocks = [
+            f"Community {i}:\n{summaries[i]}"
             for i in relevant_comms
-        ])
-        return summaries_text
+        ]
+        if max_tokens is None:
+            return "\n\n".join(blocks)
+        # relevant_comms is already ranked, so keep the best ones that fit
+        chosen = self.packer.select([(-rank, block) for rank, block in enumerate(blocks)], max_tokens)
+        return "\n\n".join(block for _, block in sorted(chosen))
 
 if __name__ == "__main__":
     client = SimpleLLMClient()
@@ -0,0 +1,51 @@
+import threading
+
+class ScriptStream:
+    """
+    A script that is still being written, handed to readers line by line.
+    The writer feeds text deltas and closes the stream; readers block in
+    read() until more complete lines arrive. Blank lines are dropped.
+    """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._parts = []
+        self._partial = ""
+        self.lines = []
+        self.closed = False
+        self.error = None
+        # Future set by the consumer synthesizing the lines (see TTSAgent.start_streaming)
+        self.audio = None
+
+    def write(self, delta):
+        with self._cond:
+            self._parts.append(delta)
+            *complete, self._partial = (self._partial + delta).split("\n")
+            added = [line.strip() for line in complete if line.strip()]
+            if added:
+                self.lines.extend(added)
+                self._cond.notify_all()
+
+    def close(self, error=None):
+        with self._cond:
+            if self.closed:
+                return
+            if self._partial.strip():
+                self.lines.append(self._partial.strip())
+            self._partial = ""
+            self.closed = True
+            self.error = error
+            self._cond.notify_all()
+
+    def read(self, start):
+        """
+        Block until there are lines past `start` or the stream is closed.
+        :return: every line available from `start` on; empty once the stream is exhausted
+        """
+        with self._cond:
+            while len(self.lines) <= start and not self.closed:
+                self._cond.wait()
+            return self.lines[start:]
+
+    def text(self):
+        with self._cond:
+            return "".join(self._parts)
@@ -0,0 +1,31 @@
+import sys
+from ann_index import VectorIndex
+from index_cache import BuildCancelled
+from text_utils import iter_chunks
+
+EMBED_BATCH_SIZE = 512
+
+class SourceIndex:
+    """Short passages of a source document, embedded once for nearest-passage lookups."""
+    def __init__(self, llm_client, source, max_tokens=120, cancel=None):
+        """:param cancel: threading.Event; once set, BuildCancelled is raised before the next embedding batch"""
+        self.passages = [chunk.text for chunk in iter_chunks(source, max_tokens=max_tokens, overlap_sentences=0)]
+        self.index = VectorIndex()
+        for start in range(0, len(self.passages), EMBED_BATCH_SIZE):
+            if cancel is not None and cancel.is_set():
+                raise BuildCancelled()
+            batch = self.passages[start:start + EMBED_BATCH_SIZE]
+            self.index.add(list(range(start, start + len(batch))), llm_client.embed_batch(batch))
+
+    def __len__(self):
+        return len(self.passages)
+
+    def estimate_bytes(self):
+        total = sum(sys.getsizeof(p) for p in self.passages)
+        if self.index.vectors is not None:
+            total += self.index.vectors.nbytes
+        return total
+
+    def search(self, query_emb, top_k=3):
+        """:return: list of (passage, cosine similarity), best first"""
+        return [(self.passages[i], score) for i, score in self.index.search(query_emb, top_k)]
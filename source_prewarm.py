@@ -0,0 +1,97 @@
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("SourcePrewarmer")
+
+
+class _Prewarm:
+    def __init__(self, cancel, timer):
+        self.cancel = cancel
+        self.timer = timer # cancels the work once the source has gone unused for the TTL
+        self.future = None
+
+
+class SourcePrewarmer:
+    """
+    Runs `work(content, cancel_event)` in the background for uploaded sources, so
+    indexes are cached by the time a podcast is requested. At most `max_workers`
+    sources are processed and `max_pending` tracked at once, and sources over
+    `max_chars` are skipped. Work for a source that is neither released (a job
+    uses it) nor finished within `ttl` seconds is cancelled.
+    """
+    def __init__(self, work, max_workers=1, max_pending=8, max_chars=2_000_000, ttl=900):
+        self.work = work
+        self.max_pending = max_pending
+        self.max_chars = max_chars
+        self.ttl = ttl
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prewarm")
+        self.lock = threading.Lock()
+        self.sources = {} # source_id -> _Prewarm
+
+    def submit(self, source_id, content):
+        """:return: 'queued', or why the source is not pre-indexed"""
+        if not content or not content.strip():
+            return 'skipped: empty'
+        if len(content) > self.max_chars:
+            return 'skipped: too large'
+        with self.lock:
+            if len(self.sources) >= self.max_pending:
+                return 'skipped: busy'
+            cancel = threading.Event()
+            timer = threading.Timer(self.ttl, self._expire, args=(source_id,))
+            timer.daemon = True
+            entry = self.sources[source_id] = _Prewarm(cancel, timer)
+            entry.future = self.executor.submit(self._run, source_id, content, cancel)
+            timer.start()
+        return 'queued'
+
+    def _run(self, source_id, content, cancel):
+        start = time.time()
+        try:
+            self.work(content, cancel)
+            if not cancel.is_set():
+                logger.info(f"Pre-indexed source {source_id} in {time.time() - start:.1f}s")
+        except Exception as e:
+            if cancel.is_set():
+                logger.info(f"Pre-indexing of source {source_id} cancelled")
+            else:
+                logger.warning(f"Pre-indexing of source {source_id} failed: {e}")
+        finally:
+            # Finished work needs no tracking; whatever it built stays cached
+            with self.lock:
+                entry = self.sources.get(source_id)
+                if entry is not None and entry.cancel is cancel:
+                    del self.sources[source_id]
+                    entry.timer.cancel()
+
+    def cancel(self, source_id):
+        with self.lock:
+            entry = self.sources.pop(source_id, None)
+        if entry is None:
+            return False
+        entry.timer.cancel()
+        entry.cancel.set()
+        entry.future.cancel()
+        return True
+
+    def release(self, source_id):
+        """Stop tracking a source a job now uses; its pre-indexing keeps running and is never expired."""
+        with self.lock:
+            entry = self.sources.pop(source_id, None)
+        if entry is None:
+            return False
+        entry.timer.cancel()
+        return True
+
+    def _expire(self, source_id):
+        if self.cancel(source_id):
+            logger.info(f"Source {source_id} unused for {self.ttl}s, pre-indexing cancelled")
+
+    def status(self, source_id):
+        with self.lock:
+            entry = self.sources.get(source_id)
+        if entry is None:
+            return None
+        return 'running' if entry.future.running() else 'queued'
@@ -22,8 +22,17 @@ document.addEventListener('DOMContentLoaded', () => {
 
     // State
     let currentSourceContent = "";
+    // Uploaded for background indexing while the topic and voice are chosen
+    let currentSourceId = null;
+    let uploadedContent = null;
     let pollInterval = null;
 
+    // Draft audio: streamed segments play in order while the rest is generated
+    let segmentQueue = [];
+    let segmentsSeen = 0;
+    let playingDraft = false;
+    let draftOffset = 0;
+
     // Tabs
     tabBtns.forEach(btn => {
         btn.addEventListener('click', () => {
@@ -50,10 +59,35 @@ document.addEventListener('DOMContentLoaded', () => {
             return;
         }
 
+        if (currentSourceContent !== uploadedContent) {
+            uploadSource(currentSourceContent);
+        }
+
         stepConfig.classList.remove('disabled');
         stepConfig.scrollIntoView({ behavior: 'smooth' });
     });
 
+    async function uploadSource(content) {
+        // Best effort: generation works the same if this fails
+        const previousId = currentSourceId;
+        currentSourceId = null;
+        uploadedContent = content;
+        try {
+            if (previousId) {
+                fetch(`/upload-source/${previousId}/cancel`, { method: 'POST' });
+            }
+            const form = new FormData();
+            form.append('text', content);
+            const response = await fetch('/upload-source', { method: 'POST', body: form });
+            const result = await response.json();
+            if (response.ok && uploadedContent === content) {
+                currentSourceId = result.source_id;
+            }
+        } catch (error) {
+            console.warn('Source pre-indexing unavailable:', error);
+        }
+    }
+
     // Generation
     generateBtn.addEventListener('click', async () => {
         const topic = topicInput.value.trim();
@@ -75,6 +109,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({
                     source_content: currentSourceContent,
+                    source_id: currentSourceContent === uploadedContent ? currentSourceId : null,
                     topic: topic,
                     voice: voice
                 })
@@ -96,6 +131,10 @@ document.addEventListener('DOMContentLoaded', () => {
 
     function startPolling(jobId) {
         if (pollInterval) clearInterval(pollInterval);
+        segmentQueue = [];
+        segmentsSeen = 0;
+        playingDraft = false;
+        draftOffset = 0;
 
         pollInterval = setInterval(async () => {
             try {
@@ -103,11 +142,25 @@ document.addEventListener('DOMContentLoaded', () => {
                 const status = await response.json();
 
                 updateAgentVisuals(status);
+                if (status.status === 'running') {
+                    queueSegments(status.audio_segments || []);
+                }
 
                 if (status.status === 'completed') {
                     clearInterval(pollInterval);
                     setLoading(generateBtn, false);
+                    // The final file is the segments joined, so pick up where the draft is
+                    const resumeAt = draftOffset + (playingDraft ? audioPlayer.currentTime : 0);
+                    const wasPlaying = draftOffset > 0 || (playingDraft && !audioPlayer.paused);
+                    playingDraft = false;
+                    segmentQueue = [];
                     displayResult(status.result, status.context?.topic || "Generated Podcast");
+                    if (resumeAt > 0) {
+                        audioPlayer.addEventListener('loadedmetadata', () => {
+                            audioPlayer.currentTime = Math.min(resumeAt, audioPlayer.duration || resumeAt);
+                            if (wasPlaying) audioPlayer.play().catch(() => {});
+                        }, { once: true });
+                    }
                     loadHistory();
                     stepResult.classList.remove('disabled');
                     stepResult.scrollIntoView({ behavior: 'smooth' });
@@ -136,14 +189,43 @@ document.addEventListener('DOMContentLoaded', () => {
             }
         });
 
-        // Update running node
-        const currentNode = document.getElementById(`node-${currentStep}`);
-        if (currentNode && !completedSteps.includes(currentStep)) {
-            currentNode.classList.add('running');
-            currentNode.querySelector('.node-status').textContent = 'Working...';
+        // Update running nodes (independent agents run side by side)
+        const runningSteps = status.running_steps || [currentStep];
+        runningSteps.forEach(step => {
+            const node = document.getElementById(`node-${step}`);
+            if (node && !completedSteps.includes(step)) {
+                node.classList.add('running');
+                node.querySelector('.node-status').textContent = 'Working...';
+            }
+        });
+    }
+
+    function queueSegments(segments) {
+        segments.slice(segmentsSeen).forEach(url => segmentQueue.push(url));
+        segmentsSeen = segments.length;
+        if (!playingDraft && segmentQueue.length) {
+            stepResult.classList.remove('disabled');
+            resultTitle.textContent = "Draft (still generating)...";
+            playNextSegment();
         }
     }
 
+    function playNextSegment() {
+        const next = segmentQueue.shift();
+        playingDraft = Boolean(next);
+        if (next) {
+            audioPlayer.src = next;
+            audioPlayer.play().catch(() => {}); // autoplay may be blocked until the user presses play
+        }
+    }
+
+    audioPlayer.addEventListener('ended', () => {
+        if (playingDraft) {
+            draftOffset += audioPlayer.duration || 0;
+            playNextSegment();
+        }
+    });
+
     function resetAgentNodes() {
         document.querySelectorAll('.agent-node').forEach(node => {
             node.classList.remove('running', 'completed');
@@ -176,7 +258,7 @@ document.addEventListener('DOMContentLoaded', () => {
     function displayResult(data, topic) {
         resultTitle.textContent = topic;
         scriptDisplay.textContent = data.script;
-        audioPlayer.src = data.audio_url;
+        audioPlayer.src = data.preview_url || data.audio_url;
         downloadLink.href = data.audio_url;
 
         // Highlight in history if exists
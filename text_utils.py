@@ -1,3 +1,24 @@
+import re
+import codecs
+
+# Words and individual punctuation marks, a rough stand-in for BPE tokens
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+# Abbreviations that never end a sentence (titles, initials)
+TITLE_ABBREVIATIONS = re.compile(r"\b(?:Mr|Mrs|Ms|Dr|Prof|St|vs|e\.g|i\.e|[A-Z])\.$")
+WORD_SPAN = re.compile(r"\S+\s*")
+
+class Chunk:
+    def __init__(self, id, text, start, end):
+        self.id = id
+        self.text = text
+        self.start = start # character offset of text in the source
+        self.end = end
+
+    def __repr__(self):
+        return f"Chunk({self.id}, {self.start}:{self.end})"
+
 def chunk_text(text, chunk_size=1000, overlap=200):
     if len(text) <= chunk_size:
         return [text]
@@ -13,6 +34,142 @@ def chunk_text(text, chunk_size=1000, overlap=200):
 
     return chunks
 
+def count_tokens(text):
+    # Approximate: one token per short word or symbol, long words count extra.
+    # Errs slightly high so budgets computed from it stay inside the real limit.
+    if not text:
+        return 0
+    return sum(1 + len(word) // 6 for word in TOKEN_PATTERN.findall(text))
+
+def sentence_spans(text):
+    """
+    Locate sentences in text.
+    :return: list of [start, end, new_paragraph]; end runs up to the next sentence
+             so consecutive spans tile the text exactly.
+    """
+    spans = []
+    pos = 0
+    breaks = [m.end() for m in SENTENCE_BREAK.finditer(text)] + [len(text)]
+    for brk in breaks:
+        piece = text[pos:brk]
+        start = pos + len(piece) - len(piece.lstrip())
+        if start < brk:
+            previous = text[spans[-1][0]:start] if spans else ""
+            # Re-join splits made after abbreviations such as "Dr." or "Apple Inc. was"
+            if spans and (text[start].islower() or TITLE_ABBREVIATIONS.search(previous.rstrip())):
+                spans[-1][1] = brk
+            else:
+                new_paragraph = bool(PARAGRAPH_BREAK.search(previous[len(previous.rstrip()):]))
+                if spans:
+                    spans[-1][1] = start
+                spans.append([start, brk, new_paragraph])
+        elif spans:
+            spans[-1][1] = brk
+        pos = brk
+    return spans
+
+def split_sentences(text):
+    return [text[start:end].strip() for start, end, _ in sentence_spans(text)]
+
+def iter_sentence_spans(source, read_size=64 * 1024):
+    """
+    Stream (offset, raw_text, new_paragraph) sentences from a string or a
+    file-like object, holding at most a few blocks of text in memory.
+    """
+    if isinstance(source, str):
+        for start, end, new_paragraph in sentence_spans(source):
+            yield start, source[start:end], new_paragraph
+        return
+
+    buffer = ""
+    base = 0
+    carried_paragraph = False
+    # Holds back a multi-byte character split across two reads
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    while True:
+        raw = source.read(read_size)
+        finished = not raw
+        block = decoder.decode(raw, final=finished) if isinstance(raw, bytes) else raw
+        buffer += block
+        spans = sentence_spans(buffer)
+        if spans:
+            spans[0][2] = spans[0][2] or carried_paragraph
+
+        if finished:
+            for start, end, new_paragraph in spans:
+                yield base + start, buffer[start:end], new_paragraph
+            return
+
+        if len(spans) > 1:
+            # The last sentence may continue in the next block, so hold it back
+            for start, end, new_paragraph in spans[:-1]:
+                yield base + start, buffer[start:end], new_paragraph
+            cut, carried_paragraph = spans[-1][0], spans[-1][2]
+        elif len(buffer) > 4 * read_size:
+            # No sentence boundary in sight: cut at the last whitespace
+            cut = buffer.rfind(" ", 0, 2 * read_size) + 1 or 2 * read_size
+            yield base, buffer[:cut], carried_paragraph
+            carried_paragraph = False
+        else:
+            continue
+        base += cut
+        buffer = buffer[cut:]
+
+def _split_long(offset, raw, max_tokens):
+    # Break a sentence longer than a whole chunk at word boundaries
+    piece_start = 0
+    tokens = 0
+    for match in WORD_SPAN.finditer(raw):
+        cost = count_tokens(match.group())
+        if tokens and tokens + cost > max_tokens:
+            yield offset + piece_start, raw[piece_start:match.start()]
+            piece_start = match.start()
+            tokens = 0
+        tokens += cost
+    if piece_start < len(raw):
+        yield offset + piece_start, raw[piece_start:]
+
+def iter_chunks(source, max_tokens=250, overlap_sentences=1, start_id=0, read_size=64 * 1024):
+    """
+    Yield Chunk objects of at most max_tokens, ending on sentence boundaries and
+    preferring paragraph breaks. Consecutive chunks within a paragraph share their
+    last `overlap_sentences` whole sentences. `source` may be a string or a
+    file-like object; offsets always refer to the original text.
+    """
+    window = [] # (offset, raw_text, tokens)
+    window_tokens = 0
+    fresh = 0 # sentences in window not yet emitted
+    chunk_id = start_id
+
+    def make_chunk():
+        text = "".join(raw for _, raw, _ in window).rstrip()
+        return Chunk(chunk_id, text, window[0][0], window[0][0] + len(text))
+
+    for offset, raw, new_paragraph in iter_sentence_spans(source, read_size):
+        if count_tokens(raw) > max_tokens:
+            pieces = list(_split_long(offset, raw, max_tokens))
+        else:
+            pieces = [(offset, raw)]
+
+        for piece_offset, piece in pieces:
+            tokens = count_tokens(piece)
+            paragraph_break = new_paragraph and window_tokens >= max_tokens // 2
+            if fresh and (window_tokens + tokens > max_tokens or paragraph_break):
+                yield make_chunk()
+                chunk_id += 1
+                window = [] if paragraph_break or not overlap_sentences else window[-overlap_sentences:]
+                while window and sum(w[2] for w in window) + tokens > max_tokens:
+                    window.pop(0)
+                window_tokens = sum(w[2] for w in window)
+                fresh = 0
+            window.append((piece_offset, piece, tokens))
+            window_tokens += tokens
+            fresh += 1
+            new_paragraph = False
+
+    if fresh:
+        yield make_chunk()
+
 if __name__ == "__main__":
     test_text = """
     Apple Inc. is an American multinational technology company.
@@ -25,4 +182,8 @@ if __name__ == "__main__":
     chunks = chunk_text(test_text, chunk_size=200, overlap=50)
     print(f"Created {len(chunks)} chunks")
     print(f"First chunk: {chunks[0][:100]}...")
-    print(f"Last chunk: {chunks[-1][:100]}...")
\ No newline at end of file
+    print(f"Last chunk: {chunks[-1][:100]}...")
+
+    sentence_chunks = list(iter_chunks(test_text, max_tokens=60))
+    print(f"Created {len(sentence_chunks)} sentence-aligned chunks")
+    print(f"First chunk {sentence_chunks[0]}: {sentence_chunks[0].text[:100]}...")
\ No newline at end of file
@@ -0,0 +1,22 @@
+import os
+import time
+import argparse
+from orchestrator import Orchestrator
+
+def run_worker(orchestrator, max_jobs=2, poll_interval=1.0):
+    """Claim queued (or orphaned) jobs from the shared store, at most `max_jobs` at a time."""
+    print(f"Worker {orchestrator.worker_id} waiting for jobs (max {max_jobs} at a time)...")
+    while True:
+        if orchestrator.active_jobs() < max_jobs and orchestrator.run_next():
+            continue
+        time.sleep(poll_interval)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run podcast jobs queued by app.py started with JOB_RUNNER=worker")
+    parser.add_argument("--jobs", type=int, default=2, help="jobs to run concurrently in this process")
+    parser.add_argument("--poll", type=float, default=1.0, help="seconds between queue checks when idle")
+    args = parser.parse_args()
+
+    output_folder = os.getenv("OUTPUT_FOLDER", "outputs")
+    os.makedirs(output_folder, exist_ok=True)
+    run_worker(Orchestrator(output_folder), max_jobs=args.jobs, poll_interval=args.poll)